@@ -0,0 +1,322 @@
+"""Raccoon Raiders: benchmarks
+
+=== Module Description ===
+This module times the core operations of the game engine on generated
+levels of many sizes (from 10x10 up to 2000x2000) and densities of raccoons,
+RecyclingBins and GarbageCans. The levels are generated from a fixed seed, so
+every run times exactly the same games.
+
+Results are saved as JSON, and two saved runs can be compared to find the
+operations that got slower. From the command line:
+
+    python racoon_raiders_bench.py run results.json [--quick]
+    python racoon_raiders_bench.py compare old.json new.json [--threshold T]
+
+compare exits with status 1 if any operation got slower by more than the
+threshold (a fraction of the old time).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import sys
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, NamedTuple, Tuple, Type
+
+from racoon_raiders_compact import CompactGameBoard
+from racoon_raiders_src import DIRECTIONS, LEFT, RACCOON_TURN_FREQUENCY, \
+    RIGHT, GameBoard
+
+# The version of the results file format written by save_results
+RESULTS_VERSION = 1
+
+# The board sizes (width and height) that are benchmarked by default, and by
+# a quick run
+SIZES = [10, 100, 500, 2000]
+QUICK_SIZES = [10, 100]
+
+# The fraction of tiles holding each kind of character, by density name
+DENSITIES = {
+    'sparse': {'R': 0.01, 'S': 0.005, 'B': 0.05, 'O': 0.005, 'C': 0.005},
+    'dense': {'R': 0.05, 'S': 0.02, 'B': 0.3, 'O': 0.02, 'C': 0.02},
+}
+
+BOARD_TYPES = [GameBoard, CompactGameBoard]
+
+# How many times each operation is timed; the fastest time is kept
+DEFAULT_REPEAT = 3
+# How many calls of the fast operations are timed together
+CALLS = 1000
+
+# By default, an operation has regressed if it is more than this fraction
+# slower than before
+DEFAULT_THRESHOLD = 0.25
+
+
+class BenchResult(NamedTuple):
+    """The time one operation took on one benchmark level.
+
+    === Attributes ===
+    case:
+        the board type, size and density of the level, such as
+        'GameBoard/100x100/dense'
+    operation:
+        the name of the operation that was timed
+    seconds:
+        the fastest time taken by one call of the operation
+    """
+    case: str
+    operation: str
+    seconds: float
+
+
+class Comparison(NamedTuple):
+    """How the time of one operation changed between two runs.
+
+    === Attributes ===
+    case, operation:
+        the operation that was timed, as in BenchResult
+    old, new:
+        the time it took in the old and the new run
+    ratio:
+        new / old
+    """
+    case: str
+    operation: str
+    old: float
+    new: float
+    ratio: float
+
+
+def make_level(size: int, density: str, seed: int) -> str:
+    """Return a level of <size> by <size> tiles with the characters of
+    <density> (a key of DENSITIES) scattered at random, and the Player in
+    the top-left corner.
+
+    >>> make_level(3, 'dense', 0) == make_level(3, 'dense', 0)
+    True
+    >>> make_level(3, 'dense', 0)[0]
+    'P'
+    """
+    rng = random.Random(seed)
+    fractions = DENSITIES[density]
+    chars = list(fractions) + ['-']
+    weights = list(fractions.values()) + [1 - sum(fractions.values())]
+    tiles = rng.choices(chars, weights, k=size * size)
+    tiles[0] = 'P'
+    return '\n'.join(''.join(tiles[y * size:(y + 1) * size])
+                     for y in range(size))
+
+
+def _best(repeat: int, setup: Callable[[], object],
+          run: Callable[[object], object], calls: int = 1) -> float:
+    """Return the fastest time, over <repeat> tries, of one call of <run>,
+    when it is called <calls> times on the result of <setup>. Only the calls
+    of <run> are timed.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        subject = setup()
+        start = perf_counter()
+        for _ in range(calls):
+            run(subject)
+        best = min(best, (perf_counter() - start) / calls)
+    return best
+
+
+def _idle_turns(board: GameBoard) -> None:
+    """Play every turn of <board> up to the next raccoon turn, moving the
+    Player back and forth.
+    """
+    while (board.turns + 1) % RACCOON_TURN_FREQUENCY:
+        board.handle_event(RIGHT if board.turns % 2 == 0 else LEFT)
+        board.give_turns()
+
+
+def bench_level(board_type: Type[GameBoard], size: int, density: str,
+                seed: int = 0,
+                repeat: int = DEFAULT_REPEAT) -> List[BenchResult]:
+    """Time every benchmarked operation on a level made by make_level, on a
+    board of type <board_type>.
+
+    >>> results = bench_level(GameBoard, 10, 'sparse', repeat=1)
+    >>> [r.operation for r in results][:2]
+    ['setup_from_grid', 'load_level']
+    >>> results[0].case
+    'GameBoard/10x10/sparse'
+    """
+    grid = make_level(size, density, seed)
+    rows = grid.split('\n')
+    board = board_type(1, 1, seed)
+    board.load_level(rows)
+    idle = RACCOON_TURN_FREQUENCY - 1
+    rng = random.Random(seed)
+    lookups = [(rng.randrange(size), rng.randrange(size),
+                rng.choice(DIRECTIONS)) for _ in range(CALLS)]
+
+    def new_board() -> GameBoard:
+        return board_type(1, 1, seed)
+
+    # a fresh board of board_type for each try; clone would not do, as a
+    # clone only makes its characters when their tiles are first used
+    def fresh() -> GameBoard:
+        subject = board_type(1, 1, seed)
+        subject.load_level(rows)
+        return subject
+
+    def before_tick() -> GameBoard:
+        subject = fresh()
+        _idle_turns(subject)
+        return subject
+
+    times = [
+        ('setup_from_grid',
+         _best(repeat, new_board, lambda b: b.setup_from_grid(grid))),
+        ('load_level', _best(repeat, new_board, lambda b: b.load_level(rows))),
+        ('give_turns', _best(repeat, fresh, _idle_turns) / idle),
+        ('give_turns_tick',
+         _best(repeat, before_tick, lambda b: b.give_turns())),
+        ('check_game_end',
+         _best(repeat, fresh, lambda b: b.check_game_end(), CALLS)),
+        ('adjacent_bin_score',
+         _best(repeat, fresh, lambda b: b.adjacent_bin_score())),
+        ('find_can', _best(repeat, lambda: iter(lookups),
+                           lambda it: board.find_can(*next(it)), CALLS)),
+        ('__str__', _best(repeat, lambda: board, str)),
+    ]
+    case = f'{board_type.__name__}/{size}x{size}/{density}'
+    return [BenchResult(case, operation, seconds)
+            for operation, seconds in times]
+
+
+def run_benchmarks(sizes: Iterable[int] = SIZES,
+                   densities: Iterable[str] = DENSITIES,
+                   board_types: Iterable[Type[GameBoard]] = BOARD_TYPES,
+                   seed: int = 0,
+                   repeat: int = DEFAULT_REPEAT) -> List[BenchResult]:
+    """Run bench_level on every combination of <board_types>, <sizes> and
+    <densities>, and return all of the results.
+    """
+    results = []
+    for board_type in board_types:
+        for size in sizes:
+            for density in densities:
+                results.extend(bench_level(board_type, size, density, seed,
+                                           repeat))
+    return results
+
+
+def save_results(results: List[BenchResult], path: str) -> None:
+    """Write <results> to the JSON file at <path>."""
+    data = {
+        'version': RESULTS_VERSION,
+        'python': platform.python_version(),
+        'results': [result._asdict() for result in results],
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1)
+
+
+def load_results(path: str) -> List[BenchResult]:
+    """Return the results in the JSON file at <path>, written by
+    save_results.
+
+    Raise a ValueError if the file is not a results file of a version that
+    can be read.
+    """
+    with open(path) as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or data.get('version') != RESULTS_VERSION:
+        raise ValueError(f'{path} is not a version {RESULTS_VERSION} '
+                         f'benchmark results file')
+    return [BenchResult(**result) for result in data['results']]
+
+
+def compare(old: List[BenchResult], new: List[BenchResult]) \
+        -> List[Comparison]:
+    """Return how the time of every operation in both <old> and <new>
+    changed, slowest first.
+
+    >>> old = [BenchResult('c', 'a', 1.0), BenchResult('c', 'b', 1.0)]
+    >>> new = [BenchResult('c', 'a', 1.5), BenchResult('c', 'b', 0.5)]
+    >>> [(c.operation, c.ratio) for c in compare(old, new)]
+    [('a', 1.5), ('b', 0.5)]
+    """
+    times: Dict[Tuple[str, str], float] = {(r.case, r.operation): r.seconds
+                                           for r in old}
+    changes = [Comparison(r.case, r.operation, times[(r.case, r.operation)],
+                          r.seconds, r.seconds / times[(r.case, r.operation)])
+               for r in new
+               if times.get((r.case, r.operation))]
+    changes.sort(key=lambda c: c.ratio, reverse=True)
+    return changes
+
+
+def regressions(changes: List[Comparison],
+                threshold: float = DEFAULT_THRESHOLD) -> List[Comparison]:
+    """Return the <changes> in which an operation got more than <threshold>
+    (a fraction of its old time) slower.
+
+    >>> regressions([Comparison('c', 'a', 1.0, 1.5, 1.5)], 0.2)
+    [Comparison(case='c', operation='a', old=1.0, new=1.5, ratio=1.5)]
+    """
+    return [c for c in changes if c.ratio > 1 + threshold]
+
+
+def _main(args: List[str]) -> int:
+    """Run the command line <args> (see the module description) and return
+    the exit status.
+    """
+    parser = argparse.ArgumentParser(description='Raccoon Raiders benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='run the benchmarks')
+    run.add_argument('output', help='the JSON file to write the results to')
+    run.add_argument('--quick', action='store_true',
+                     help='only benchmark the small boards')
+    run.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    run.add_argument('--seed', type=int, default=0)
+    comparing = commands.add_parser('compare', help='compare two runs')
+    comparing.add_argument('old')
+    comparing.add_argument('new')
+    comparing.add_argument('--threshold', type=float,
+                           default=DEFAULT_THRESHOLD)
+    options = parser.parse_args(args)
+
+    if options.command == 'run':
+        sizes = QUICK_SIZES if options.quick else SIZES
+        results = run_benchmarks(sizes, seed=options.seed,
+                                 repeat=options.repeat)
+        save_results(results, options.output)
+        for result in results:
+            print(f'{result.case:32} {result.operation:20} '
+                  f'{result.seconds * 1e6:14.2f} us')
+        return 0
+
+    changes = compare(load_results(options.old), load_results(options.new))
+    slower = regressions(changes, options.threshold)
+    for change in changes:
+        flag = 'REGRESSION' if change in slower else ''
+        print(f'{change.case:32} {change.operation:20} '
+              f'{change.ratio:8.2f}x {flag}')
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['save_results', 'load_results', '_main'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   '__future__', 'argparse', 'json',
+                                   'platform', 'random', 'sys', 'time',
+                                   'racoon_raiders_compact',
+                                   'racoon_raiders_src'],
+        'disable': ['E1136'],
+    })
+
+    sys.exit(_main(sys.argv[1:]))
@@ -0,0 +1,319 @@
+"""Raccoon Raiders: game boards for large levels
+
+=== Module Description ===
+This module contains two kinds of GameBoard that store their characters
+more compactly than a GameBoard does, for levels too large for a list per
+tile. A CompactGameBoard stores only the tiles that have characters on them,
+and a SparseGameBoard also stores only the tile codes and blocked neighbour
+counts that differ from those of an empty board. Both behave exactly like a
+GameBoard.
+"""
+
+from __future__ import annotations
+
+import sys
+from typing import Dict, Iterable, List, Tuple, Union
+
+from racoon_raiders_grid import EMPTY_CODE
+from racoon_raiders_snapshot import pack_tile_table
+from racoon_raiders_src import Character, GameBoard
+
+
+class CompactGameBoard(GameBoard):
+    """A game board that only stores the tiles that have characters on them.
+
+    A GameBoard keeps a list for every tile, so a large board uses a lot of
+    memory once its characters are made. A CompactGameBoard instead keeps the
+    characters of the occupied tiles in a dictionary, and relies on the
+    one-byte tile codes that every board stores for everything else.
+    A tile with a single character stores just that character, so most
+    tiles need no list of their own. It behaves exactly like a GameBoard.
+
+    === Sample Usage ===
+    >>> from racoon_raiders_src import RIGHT
+    >>> b = CompactGameBoard(4, 4)
+    >>> b.setup_from_grid('P-B-\\n-BRB\\n--BB\\n-C--')
+    >>> str(b)
+    'P-B-\\n-BRB\\n--BB\\n-C--'
+    >>> b.at(0, 0)[0].move(RIGHT)
+    True
+    >>> b.at(0, 0)
+    []
+    >>> kinds = [GameBoard, CompactGameBoard, SparseGameBoard]
+    >>> sizes = []
+    >>> for kind in kinds:
+    ...     board = kind(100, 100)
+    ...     board.setup_from_grid('\\n'.join(['B' + '-' * 99] * 100))
+    ...     _ = [board.at(x, y) for y in range(100) for x in range(100)]
+    ...     sizes.append(board.memory_usage())
+    >>> sizes == sorted(sizes, reverse=True)
+    True
+    """
+    # === Private Attributes ===
+    # _board:
+    #   the characters on each occupied tile, keyed by the tile's index in
+    #   _grid: the character itself if there is only one, or a list of them
+    #   otherwise. A tile with no entry has no characters if its code is
+    #   EMPTY_CODE, and has not been used yet otherwise (see _unpack).
+
+    _board: Dict[int, Union[Character, List[Character]]]
+
+    def _new_tiles(self) -> Dict[int, Union[Character, List[Character]]]:
+        """Return the tiles of a new board, none of which have been used."""
+        return {}
+
+    def at(self, x: int, y: int) -> List[Character]:
+        """Return the characters at tile (x, y).
+
+        If there are no characters or if the (x, y) coordinates are not
+        on the board, return an empty list.
+
+        >>> from racoon_raiders_src import Raccoon
+        >>> b = CompactGameBoard(3, 2)
+        >>> r = Raccoon(b, 1, 1)
+        >>> b.at(1, 1) == [r]
+        True
+        >>> b.at(3, 0)
+        []
+        """
+        if not self.on_board(x, y):
+            return []
+        i = y * self.width + x
+        chars = self._board.get(i)
+        if chars is None:
+            if self._grid[i] == EMPTY_CODE:
+                return []
+            chars = self._unpack(i)
+            if not chars:
+                return chars
+            self._board[i] = chars[0] if len(chars) == 1 else chars
+            return chars
+        elif isinstance(chars, list):
+            return chars
+        return [chars]
+
+    def _stored(self, x: int, y: int) -> List[Character]:
+        """Return the characters stored for tile (x, y), which is on this
+        board and has been used by _put or _take.
+        """
+        chars = self._board.get(y * self.width + x)
+        if chars is None:
+            return []
+        elif isinstance(chars, list):
+            return chars
+        return [chars]
+
+    def _put(self, x: int, y: int, c: Character) -> None:
+        """Add character <c> on top of the characters at tile (x, y)."""
+        chars = self.at(x, y)
+        if chars:
+            self._board[y * self.width + x] = [chars[0], c]
+        else:
+            self._board[y * self.width + x] = c
+
+    def _take(self, x: int, y: int) -> Character:
+        """Remove and return the top character at tile (x, y)."""
+        chars = self.at(x, y)
+        i = y * self.width + x
+        if len(chars) == 2:
+            self._board[i] = chars[0]
+        else:
+            del self._board[i]
+        return chars[-1]
+
+    def _replace(self, x: int, y: int, c: Character) -> None:
+        """Replace the only character at tile (x, y) with <c>."""
+        self._board[y * self.width + x] = c
+
+    def _tiles_memory(self) -> int:
+        """Return roughly how many bytes the tiles and the characters on
+        them use.
+        """
+        size = sys.getsizeof(self._board)
+        for chars in self._board.values():
+            size += sys.getsizeof(chars)
+            if isinstance(chars, list):
+                size += sum(map(sys.getsizeof, chars))
+        return size
+
+
+class SparseGameBoard(CompactGameBoard):
+    """A game board whose memory use depends only on how many characters
+    are on it, for huge boards that are mostly empty.
+
+    A CompactGameBoard still stores a tile code and a blocked neighbour count
+    for every tile. A SparseGameBoard stores these only for the tiles where
+    they differ from those of an empty board, so creating one takes constant
+    time whatever its size, and its snapshots are sparse snapshots (see
+    racoon_raiders_snapshot). It behaves exactly like a GameBoard.
+
+    === Sample Usage ===
+    >>> from racoon_raiders_src import DOWN, LEFT, GarbageCan, Player
+    >>> b = SparseGameBoard(10000, 10000)
+    >>> p = Player(b, 9999, 0)
+    >>> _ = GarbageCan(b, 9998, 0, False)
+    >>> p.move(LEFT)
+    True
+    >>> b.char_at(9998, 0)
+    'C'
+    >>> p.move(DOWN)
+    True
+    >>> b.at(9999, 1) == [p]
+    True
+    >>> b.on_board(10000, 1)
+    False
+    """
+    _grid: _SparseCodes
+
+    def _new_codes(self) -> _SparseCodes:
+        """Return the tile codes of a new, empty board."""
+        return _SparseCodes()
+
+    def _new_blocked(self) -> _SparseBlockedCounts:
+        """Return the blocked neighbour counts of a new, empty board."""
+        return _SparseBlockedCounts(self.width, self.height)
+
+    def _occupied(self) -> Iterable[Tuple[int, int]]:
+        """Return the _grid index and the tile code of every tile that is
+        not empty, in order of index.
+
+        >>> from racoon_raiders_src import Raccoon
+        >>> b = SparseGameBoard(10000, 10000)
+        >>> _ = Raccoon(b, 9999, 9999)
+        >>> b.state_hash == b.compute_state_hash() != 0
+        True
+        >>> b.take_changes()
+        [(9999, 9999, 'R')]
+        """
+        return sorted(self._grid.items())
+
+    def to_grid(self) -> List[List[chr]]:
+        """
+        Return the game state as a list of lists of chrs (letters), as
+        described in GameBoard.to_grid.
+
+        >>> from racoon_raiders_src import Player, Raccoon
+        >>> b = SparseGameBoard(3, 2)
+        >>> _ = Player(b, 0, 0)
+        >>> _ = Raccoon(b, 1, 1)
+        >>> b.to_grid()
+        [['P', '-', '-'], ['-', 'R', '-']]
+        """
+        output = []
+        for y in range(self.height):
+            row = ['-'] * self.width
+            for x in self._stops.row(y):
+                row[x] = self.char_at(x, y)
+            output.append(row)
+        if self._player is not None:
+            output[self._player.y][self._player.x] = 'P'
+        return output
+
+    def _snapshot_tiles(self) -> Tuple[bytes, bool]:
+        """Return the table of a sparse snapshot of this board, so that the
+        size of the snapshot depends only on how many characters are on it.
+
+        >>> from racoon_raiders_src import Player
+        >>> b = SparseGameBoard(20000, 20000)
+        >>> _ = Player(b, 19999, 19999)
+        >>> b2 = SparseGameBoard(1, 1)
+        >>> b2.load_snapshot(b.to_snapshot())
+        >>> b2.at(19999, 19999)[0].get_char(), len(b.to_snapshot()) < 3000
+        ('P', True)
+        """
+        return pack_tile_table(self._occupied()), True
+
+    def observation(self) -> memoryview:
+        """Raise a ValueError, as a SparseGameBoard does not store a tile
+        code for every tile to give a view of.
+
+        >>> SparseGameBoard(3, 2).observation()
+        Traceback (most recent call last):
+        ValueError: a SparseGameBoard has no view of every tile
+        """
+        raise ValueError('a SparseGameBoard has no view of every tile')
+
+
+class _SparseCodes(dict):
+    """The tile codes of a SparseGameBoard, keyed by tile index.
+
+    Only the tiles that are not empty have an entry, and setting a tile to
+    EMPTY_CODE removes its entry.
+    """
+
+    def __missing__(self, i: int) -> int:
+        """Return the code of the empty tile at index <i>."""
+        return EMPTY_CODE
+
+    def copy(self) -> _SparseCodes:
+        """Return a copy of these codes."""
+        codes = _SparseCodes()
+        dict.update(codes, self)
+        return codes
+
+    def __setitem__(self, i: int, code: int) -> None:
+        """Set the code of the tile at index <i> to <code>."""
+        if code == EMPTY_CODE:
+            self.pop(i, None)
+        else:
+            dict.__setitem__(self, i, code)
+
+
+class _SparseBlockedCounts(dict):
+    """The blocked neighbour counts of a SparseGameBoard, keyed by tile index.
+
+    Only the tiles whose count differs from the number of board edges they
+    are next to have an entry.
+
+    === Public Attributes ===
+    width, height:
+        the size of the board these counts are for
+    """
+    width: int
+    height: int
+
+    def __init__(self, w: int, h: int) -> None:
+        """Initialize the counts of an empty board of width <w> and
+        height <h>.
+        """
+        dict.__init__(self)
+        self.width = w
+        self.height = h
+
+    def __missing__(self, i: int) -> int:
+        """Return the count of the tile at index <i> on an empty board."""
+        return self._edges(i)
+
+    def copy(self) -> _SparseBlockedCounts:
+        """Return a copy of these counts."""
+        counts = _SparseBlockedCounts(self.width, self.height)
+        dict.update(counts, self)
+        return counts
+
+    def __setitem__(self, i: int, count: int) -> None:
+        """Set the count of the tile at index <i> to <count>."""
+        if count == self._edges(i):
+            self.pop(i, None)
+        else:
+            dict.__setitem__(self, i, count)
+
+    def _edges(self, i: int) -> int:
+        """Return how many board edges the tile at index <i> is next to."""
+        x, y = i % self.width, i // self.width
+        return (x == 0) + (x == self.width - 1) + (y == 0) + \
+            (y == self.height - 1)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   '__future__', 'sys', 'racoon_raiders_grid',
+                                   'racoon_raiders_snapshot',
+                                   'racoon_raiders_src'],
+        'disable': ['E1136'],
+    })
@@ -0,0 +1,1225 @@
+"""Raccoon Raiders: tile codes and board indexes
+
+=== Module Description ===
+This module keeps what a GameBoard knows about its tiles without looking at
+the characters on them: the code of every tile, and the indexes that are kept
+up to date from those codes as the characters move. These indexes let a board
+find its trapped raccoons, its largest cluster of recycling bins, what ends a
+SmartRaccoon's line of sight, and the tiles of each kind, without scanning
+the whole board.
+
+GameBoard is a TileGrid, and each index is a small helper object that the
+TileGrid owns.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right, insort
+from heapq import heappop, heappush
+import re
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Tile codes stored by a TileGrid: the ords of the letters that
+# GameBoard.to_grid gives for each tile ('@' is a Raccoon inside a GarbageCan)
+EMPTY_CODE = ord('-')
+IN_CAN_CODE = ord('@')
+PLAYER_CODE = ord('P')
+RACCOON_CODE = ord('R')
+SMART_RACCOON_CODE = ord('S')
+BIN_CODE = ord('B')
+OPEN_CAN_CODE = ord('O')
+CLOSED_CAN_CODE = ord('C')
+# Codes of tiles that a Raccoon cannot move onto, of Raccoons that are not
+# inside a GarbageCan, and of every tile with a Raccoon on it
+BLOCKING_CODES = frozenset(ord(c) for c in 'PRSB@')
+FREE_RACCOON_CODES = frozenset(ord(c) for c in 'RS')
+RACCOON_CODES = frozenset(ord(c) for c in 'RS@')
+# Codes of tiles that end a SmartRaccoon's line of sight (everything except
+# empty tiles and the Player)
+SIGHT_STOP_CODES = frozenset(ord(c) for c in 'RSB@CO')
+CAN_CODES = frozenset(ord(c) for c in 'CO')
+
+# The chars that may appear in a level
+LEVEL_CHARS = frozenset('RSPOCB@-')
+
+# Matches every tile code that is not EMPTY_CODE
+OCCUPIED = re.compile(b'[^-]')
+
+# TileGrid.state_hash values are kept to 64 bits
+HASH_MASK = (1 << 64) - 1
+
+
+class TileGrid:
+    """The tile codes of a game board, and the indexes kept up to date from
+    them as the board changes.
+
+    This is the part of a GameBoard that never looks at its characters: the
+    GameBoard works out the new code of every tile that it changes, and the
+    TileGrid updates its indexes to match.
+
+    === Public Attributes ===
+    state_hash:
+        a 64-bit hash of what is on every tile, which is kept up to date as
+        characters move, so that it can be read in constant time. It is the
+        XOR of a key for the code of every tile that is not empty, so boards
+        of the same width with the same tiles have the same state_hash.
+    width:
+        the number of squares wide this board is
+    height:
+        the number of squares high this board is
+    """
+    # === Private Attributes ===
+    # _grid:
+    #   the tile code (the ord of the to_grid letter) of every tile, stored
+    #   row by row, so tile (x, y) is at index y * width + x
+    # _grid_shared:
+    #   whether _grid is shared with a clone of this board (or the board this
+    #   one was cloned from), so must be copied before it is changed
+    # _viewed:
+    #   whether observation has given a view of _grid, which must then keep
+    #   showing this board's own codes, so is never shared
+    # _roster:
+    #   the Raccoons on the board, and the blocked neighbour counts that tell
+    #   which of them are trapped
+    # _bins:
+    #   the clusters of adjacent RecyclingBins
+    # _stops:
+    #   the tiles that end a SmartRaccoon's line of sight
+    # _changed:
+    #   the tile code, keyed by _grid index, that each tile changed since
+    #   take_changes was last called had before its first change, or None if
+    #   take_changes has not been called since this board was set up
+    # _positions:
+    #   the _grid indexes of the tiles with each tile code, keyed by code,
+    #   for every code but EMPTY_CODE, or None if no positions have been
+    #   asked for since this board was set up
+
+    state_hash: int
+    width: int
+    height: int
+    _grid: bytearray
+    _grid_shared: bool
+    _viewed: bool
+    _roster: RaccoonRoster
+    _bins: BinClusters
+    _stops: SightStops
+    _changed: Optional[Dict[int, int]]
+    _positions: Optional[Dict[int, Set[int]]]
+
+    def __init__(self, w: int, h: int) -> None:
+        """Initialize the tile codes and indexes of an empty board of width
+        <w> and height <h>.
+        """
+        self.width = w
+        self.height = h
+        self.state_hash = 0
+        self._grid = self._new_codes()
+        self._grid_shared = False
+        self._viewed = False
+        self._roster = RaccoonRoster(self._new_blocked(), w)
+        self._bins = BinClusters(w, h)
+        self._stops = SightStops()
+        self._changed = None
+        self._positions = None
+
+    def _new_codes(self) -> bytearray:
+        """Return the tile codes of a new, empty board."""
+        return bytearray([EMPTY_CODE]) * (self.width * self.height)
+
+    def _new_blocked(self) -> bytearray:
+        """Return the blocked neighbour counts of a new, empty board, where
+        only the board edges block the tiles along them.
+        """
+        w, h = self.width, self.height
+        blocked = bytearray(w * h)
+        for i in range(w):
+            blocked[i] += 1
+            blocked[(h - 1) * w + i] += 1
+        for i in range(h):
+            blocked[i * w] += 1
+            blocked[i * w + w - 1] += 1
+        return blocked
+
+    def _set_code(self, x: int, y: int, code: int) -> None:
+        """Set the code of tile (x, y) to <code>, and update every index."""
+        i = y * self.width + x
+        old = self._grid[i]
+        if old == code:
+            return
+        if self._grid_shared:
+            self._own_grid()
+        if self._changed is not None and i not in self._changed:
+            self._changed[i] = old
+        if self._positions is not None:
+            if old != EMPTY_CODE:
+                self._positions[old].discard(i)
+            if code != EMPTY_CODE:
+                self._positions.setdefault(code, set()).add(i)
+        roster = self._roster
+        roster.count(old, i, -1)
+        self._grid[i] = code
+        self.state_hash ^= tile_key(i, old) ^ tile_key(i, code)
+        if old == BIN_CODE or code == BIN_CODE:
+            self._bins.changed(i, code == BIN_CODE, self._grid)
+        if (old in SIGHT_STOP_CODES) != (code in SIGHT_STOP_CODES):
+            if code in SIGHT_STOP_CODES:
+                self._stops.add(x, y)
+            else:
+                self._stops.remove(x, y)
+        if (old in BLOCKING_CODES) != (code in BLOCKING_CODES):
+            roster.block(neighbours(i, self.width, self.height),
+                         1 if code in BLOCKING_CODES else -1, self._grid)
+        roster.count(code, i, 1)
+
+    def _load_tiles(self, tiles: Iterable[Tuple[int, int]]) \
+            -> List[Tuple[int, int]]:
+        """Set the codes of the tiles in <tiles>, given as the index and code
+        of every tile that is not empty in order of index, on this empty
+        board, and fill in the indexes in bulk.
+
+        Return the index and code of every tile with a Player or a Raccoon on
+        it, in order of index. These are not added to the roster, and the
+        roster's counts are left for the caller to make once they are.
+        """
+        grid, width, height = self._grid, self.width, self.height
+        blocked = self._roster.blocked
+        movers = []
+        for i, code in tiles:
+            grid[i] = code
+            self.state_hash ^= tile_key(i, code)
+            if code in BLOCKING_CODES:
+                movers.append((i, code))
+                for j in neighbours(i, width, height):
+                    blocked[j] += 1
+            if code in SIGHT_STOP_CODES:
+                # tiles are visited in order, so the stops stay sorted
+                self._stops.append(i % width, i // width)
+            if code == BIN_CODE:
+                self._bins.add(i)
+        return [(i, code) for i, code in movers if code != BIN_CODE]
+
+    def _clone_tiles(self, other: TileGrid) -> None:
+        """Give <other>, a new board of the same type as this one, copies of
+        this board's tile codes and indexes.
+
+        The copies share their data with this board's until one of the
+        boards changes it, so this takes time in the number of rows and
+        columns of the board rather than in its number of tiles. The tile
+        codes are copied at once only if they are being observed.
+        """
+        other.width = self.width
+        other.height = self.height
+        other.state_hash = self.state_hash
+        if self._viewed:
+            other._grid = self._grid.copy()
+            other._grid_shared = False
+        else:
+            other._grid = self._grid
+            self._grid_shared = other._grid_shared = True
+        other._viewed = False
+        other._roster = self._roster.copy()
+        other._bins = self._bins.copy()
+        other._stops = self._stops.copy()
+        other._changed = None
+        other._positions = None
+
+    def _own_grid(self) -> None:
+        """Copy _grid if it is shared, so that it can be changed."""
+        if self._grid_shared:
+            self._grid = self._grid.copy()
+            self._grid_shared = False
+
+    def char_at(self, x: int, y: int) -> chr:
+        """Return the letter that represents tile (x, y) in to_grid.
+
+        Unlike to_grid, this does not build the whole grid, so it takes
+        constant time.
+
+        Precondition:
+        - self.on_board(x, y)
+
+        >>> from racoon_raiders_src import GameBoard, Raccoon
+        >>> b = GameBoard(3, 2)
+        >>> _ = Raccoon(b, 1, 1)
+        >>> b.char_at(1, 1)
+        'R'
+        >>> b.char_at(0, 0)
+        '-'
+        """
+        return chr(self._grid[y * self.width + x])
+
+    def observation(self) -> memoryview:
+        """Return a read-only view of the game state, with one row of tile
+        codes per row of this board: the ord of the letter that to_grid gives
+        for each tile.
+
+        The view reads the board's own tile codes, without copying them, so
+        it shows every change made to the board, also after the board is set
+        up with a new level of the same width and height. After a level of
+        another size is set up, the view must be fetched again. It can be
+        wrapped in an array (for example with numpy.asarray) without copying
+        either.
+
+        >>> from racoon_raiders_src import GameBoard, Player, Raccoon, RIGHT
+        >>> b = GameBoard(3, 2)
+        >>> p = Player(b, 0, 0)
+        >>> _ = Raccoon(b, 1, 1)
+        >>> view = b.observation()
+        >>> view.shape
+        (2, 3)
+        >>> chr(view[1, 1])
+        'R'
+        >>> p.move(RIGHT)
+        True
+        >>> bytes(view)
+        b'-P--R-'
+        >>> b.setup_from_grid('--R\\nP--')
+        >>> bytes(view)
+        b'--RP--'
+        """
+        self._own_grid()
+        self._viewed = True
+        with memoryview(self._grid) as view:
+            return view.toreadonly().cast('B', (self.height, self.width))
+
+    def take_changes(self) -> List[Tuple[int, int, chr]]:
+        """Return the tiles that have changed since this method was last
+        called, as (x, y, letter) for each tile, where the letter is what
+        to_grid now gives for the tile, in order of position.
+
+        The first time this is called (and the first time after the board has
+        been set up with a new level or cloned) every tile that is not empty
+        is returned, so the whole board can be drawn once and then kept up to
+        date by drawing only the tiles that change. Calling this after every
+        call of give_turns gives the changes made by each turn. A tile that
+        changed but then changed back is not returned.
+
+        >>> from racoon_raiders_src import GameBoard, RIGHT
+        >>> b = GameBoard(4, 2)
+        >>> b.setup_from_grid('PB--\\n-O-R')
+        >>> b.take_changes()
+        [(0, 0, 'P'), (1, 0, 'B'), (1, 1, 'O'), (3, 1, 'R')]
+        >>> b.handle_event(RIGHT)
+        >>> b.give_turns()
+        >>> b.take_changes()
+        [(0, 0, '-'), (1, 0, 'P'), (2, 0, 'B')]
+        >>> b.give_turns()
+        >>> b.take_changes()
+        []
+        """
+        width, grid, changed = self.width, self._grid, self._changed
+        if changed is None:
+            tiles = [(i % width, i // width, chr(code))
+                     for i, code in self._occupied()]
+        else:
+            tiles = [(i % width, i // width, chr(grid[i]))
+                     for i in sorted(changed) if grid[i] != changed[i]]
+        self._changed = {}
+        return tiles
+
+    def positions_of(self, char: chr) -> List[Tuple[int, int]]:
+        """Return the position (x, y) of every tile for which to_grid gives
+        <char>, in order of position.
+
+        As in to_grid, 'O' gives only the open GarbageCans with no Raccoon in
+        them; the open GarbageCans holding a Raccoon are given by '@'.
+
+        The tiles are looked up in an index of the tiles of each kind, which
+        is built the first time positions are asked for and then kept up to
+        date as the board changes. The index is not ordered, so finding k
+        tiles takes O(k log k) time to sort them.
+
+        Precondition:
+        - char is in LEVEL_CHARS, and is not '-'
+
+        >>> from racoon_raiders_src import GameBoard, Raccoon, UP
+        >>> b = GameBoard(3, 3)
+        >>> b.setup_from_grid('O-B\\nBP-\\n-BO')
+        >>> b.positions_of('B')
+        [(2, 0), (0, 1), (1, 2)]
+        >>> b.at(1, 1)[0].move(UP)
+        True
+        >>> b.positions_of('P'), b.positions_of('O')
+        ([(1, 0)], [(0, 0), (2, 2)])
+        >>> _ = Raccoon(b, 0, 0)
+        >>> b.positions_of('O'), b.positions_of('@')
+        ([(2, 2)], [(0, 0)])
+        """
+        width = self.width
+        return [(i % width, i // width)
+                for i in sorted(self._index().get(ord(char), ()))]
+
+    def positions_in(self, char: chr, x0: int, y0: int, x1: int,
+                     y1: int) -> List[Tuple[int, int]]:
+        """Return the position (x, y) of every tile in the rectangle from
+        tile (x0, y0) to tile (x1, y1), inclusive, for which to_grid gives
+        <char>, in order of position.
+
+        Either the tiles of the rectangle or the tiles of that kind are
+        checked, whichever there are fewer of; in the second case, the tiles
+        found are sorted as in positions_of. Parts of the rectangle that are
+        off the board are ignored.
+
+        Precondition:
+        - char is in LEVEL_CHARS, and is not '-'
+
+        >>> from racoon_raiders_src import GameBoard
+        >>> b = GameBoard(4, 3)
+        >>> b.setup_from_grid('B-B-\\n-BPB\\nBB--')
+        >>> b.positions_in('B', 1, 0, 3, 1)
+        [(2, 0), (1, 1), (3, 1)]
+        >>> b.positions_in('B', -5, 2, 1, 9)
+        [(0, 2), (1, 2)]
+        """
+        x0, y0 = max(x0, 0), max(y0, 0)
+        x1, y1 = min(x1, self.width - 1), min(y1, self.height - 1)
+        if x0 > x1 or y0 > y1:
+            return []
+        code = ord(char)
+        width = self.width
+        tiles = self._index().get(code, ())
+        if (x1 - x0 + 1) * (y1 - y0 + 1) < len(tiles):
+            grid = self._grid
+            return [(x, y) for y in range(y0, y1 + 1)
+                    for x in range(x0, x1 + 1) if grid[y * width + x] == code]
+        return [(i % width, i // width) for i in sorted(tiles)
+                if x0 <= i % width <= x1 and y0 <= i // width <= y1]
+
+    def raccoon_can_enter(self, x: int, y: int) -> bool:
+        """Return whether a Raccoon could move onto tile (x, y): whether it
+        is on this board and is empty or holds an open GarbageCan with no
+        Raccoon in it.
+
+        >>> from racoon_raiders_src import GameBoard
+        >>> b = GameBoard(3, 1)
+        >>> b.setup_from_grid('OB-')
+        >>> [b.raccoon_can_enter(x, 0) for x in range(-1, 4)]
+        [False, True, False, True, False]
+        """
+        return 0 <= x < self.width and 0 <= y < self.height and \
+            self._grid[y * self.width + x] in (EMPTY_CODE, OPEN_CAN_CODE)
+
+    def _index(self) -> Dict[int, Set[int]]:
+        """Return the _grid indexes of the tiles with each tile code, as
+        described for _positions, building the index if there is none.
+        """
+        if self._positions is None:
+            positions = {}
+            for i, code in self._occupied():
+                positions.setdefault(code, set()).add(i)
+            self._positions = positions
+        return self._positions
+
+    def compute_state_hash(self) -> int:
+        """Return the state_hash of this board, computed from scratch from
+        the code of every tile.
+
+        This is the slow check that state_hash is compared against in debug
+        mode.
+
+        >>> from racoon_raiders_src import GameBoard, Player, RecyclingBin
+        >>> from racoon_raiders_src import RIGHT
+        >>> b = GameBoard(3, 2)
+        >>> p = Player(b, 0, 0)
+        >>> _ = RecyclingBin(b, 1, 0)
+        >>> start = b.state_hash
+        >>> p.move(RIGHT)
+        True
+        >>> b.state_hash == b.compute_state_hash() != start
+        True
+        >>> b.move(1, 0, 0, 0)
+        >>> b.move(2, 0, 1, 0)
+        >>> b.state_hash == start
+        True
+        """
+        state_hash = 0
+        for i, code in self._occupied():
+            state_hash ^= tile_key(i, code)
+        return state_hash
+
+    def _occupied(self) -> Iterable[Tuple[int, int]]:
+        """Return the _grid index and the tile code of every tile that is
+        not empty, in order of index.
+        """
+        return occupied(self._grid)
+
+    def trapped_raccoons(self) -> int:
+        """Return how many Raccoons on this board are currently trapped.
+
+        >>> from racoon_raiders_src import GameBoard, Raccoon, RecyclingBin
+        >>> b = GameBoard(3, 2)
+        >>> _ = Raccoon(b, 1, 0)
+        >>> _ = RecyclingBin(b, 1, 1)
+        >>> b.trapped_raccoons()
+        0
+        >>> _ = RecyclingBin(b, 0, 0)
+        >>> _ = RecyclingBin(b, 2, 0)
+        >>> b.trapped_raccoons()
+        1
+        """
+        return self._roster.trapped
+
+    def to_grid(self) -> List[List[chr]]:
+        """
+        Return the game state as a list of lists of chrs (letters) where:
+
+        'R' = Raccoon
+        'S' = SmartRaccoon
+        'P' = Player
+        'C' = closed GarbageCan
+        'O' = open GarbageCan
+        'B' = RecyclingBin
+        '@' = Raccoon in GarbageCan
+        '-' = Empty tile
+
+        Each inner list represents one row of the game board.
+
+        >>> from racoon_raiders_src import GameBoard, GarbageCan
+        >>> from racoon_raiders_src import Player, Raccoon
+        >>> b = GameBoard(3, 2)
+        >>> _ = Player(b, 0, 0)
+        >>> _ = Raccoon(b, 1, 1)
+        >>> _ = GarbageCan(b, 2, 1, True)
+        >>> b.to_grid()
+        [['P', '-', '-'], ['-', 'R', 'C']]
+        """
+        output = []
+        for y in range(self.height):
+            start = y * self.width
+            output.append(list(self._grid[start:start + self.width].decode()))
+        return output
+
+    def __str__(self) -> str:
+        """
+        Return a string representation of this board.
+
+        The format is the same as expected by the setup_from_grid method.
+
+        >>> from racoon_raiders_src import GameBoard, GarbageCan
+        >>> from racoon_raiders_src import Player, Raccoon
+        >>> b = GameBoard(3, 2)
+        >>> _ = Raccoon(b, 1, 1)
+        >>> print(b)
+        ---
+        -R-
+        >>> _ = Player(b, 0, 0)
+        >>> _ = GarbageCan(b, 2, 1, False)
+        >>> print(b)
+        P--
+        -RO
+        >>> str(b)
+        'P--\\n-RO'
+        """
+        return '\n'.join(''.join(row) for row in self.to_grid())
+
+    def memory_usage(self) -> int:
+        """Return roughly how many bytes this board uses to store its tiles,
+        its characters and its indexes.
+
+        A GameBoard's characters are only made when their tiles are first
+        used, so this grows as more of the board is played on.
+
+        >>> from racoon_raiders_src import GameBoard
+        >>> b = GameBoard(100, 100)
+        >>> b.setup_from_grid('\\n'.join(['B' * 100] * 100))
+        >>> before = b.memory_usage()
+        >>> _ = b.at(0, 0)
+        >>> before < b.memory_usage()
+        True
+        """
+        return sys.getsizeof(self._grid) + self._roster.memory_usage() + \
+            self._bins.memory_usage() + self._stops.memory_usage() + \
+            self._tiles_memory()
+
+    def _tiles_memory(self) -> int:
+        """Return roughly how many bytes the tiles and the characters on
+        them use, which is nothing for a grid with no characters.
+        """
+        return 0
+
+
+class RaccoonRoster:
+    """The Raccoons on a board, kept as the indexes of their tiles: the
+    order they take their turns in, which of them the next step visits, and
+    how many of them are trapped or inside a GarbageCan.
+
+    Each Raccoon is known by its rank, its place in the turn order. The
+    roster holds the tile and the class of each Raccoon rather than the
+    Raccoon itself, so that a board can make its Raccoons only when they are
+    first used.
+
+    A copy of a roster shares its lists, its blocked counts and the chunks
+    of its tile indexes with the original, and each of them is copied only
+    when the copy or the original first changes it.
+
+    === Public Attributes ===
+    tiles:
+        the index of the tile of the Raccoon of each rank
+    kinds:
+        the class of the Raccoon of each rank
+    blocked:
+        for every tile, how many of its four neighbours are off the board or
+        hold something a Raccoon cannot move onto
+    trapped:
+        the number of Raccoons that are trapped
+    in_can:
+        the number of Raccoons that are inside a GarbageCan
+
+    === Representation Invariants ===
+    len(tiles) == len(kinds)
+    """
+    # === Private Attributes ===
+    # _shared:
+    #   whether tiles, kinds and _active are shared with a copy of this
+    #   roster (or the roster this one was copied from), so must be copied
+    #   before they are changed
+    # _blocked_shared:
+    #   whether blocked is shared in the same way
+    # _ranks:
+    #   the rank of the Raccoon on each tile, keyed by tile index, in a chunk
+    #   per board row
+    # _active:
+    #   the sorted ranks of the Raccoons that the next step visits. Raccoons
+    #   that have entered a GarbageCan can never move again, so they are left
+    #   out for good.
+    # _sleeping:
+    #   the ranks of the trapped Raccoons that have been put to sleep, keyed
+    #   by tile index, in a chunk per board row
+    # _woken:
+    #   a heap of the ranks of the sleeping Raccoons that have been woken,
+    #   because one of their neighbouring tiles was freed, but have not been
+    #   given a turn since
+
+    tiles: List[int]
+    kinds: List[type]
+    blocked: bytearray
+    trapped: int
+    in_can: int
+    _shared: bool
+    _blocked_shared: bool
+    _ranks: SharedChunks
+    _active: List[int]
+    _sleeping: SharedChunks
+    _woken: List[int]
+
+    def __init__(self, blocked: bytearray, width: int) -> None:
+        """Initialize an empty roster for a board of width <width> whose
+        blocked neighbour counts are <blocked>.
+        """
+        self.tiles = []
+        self.kinds = []
+        self.blocked = blocked
+        self.trapped = 0
+        self.in_can = 0
+        self._shared = False
+        self._blocked_shared = False
+        self._ranks = SharedChunks(width)
+        self._active = []
+        self._sleeping = SharedChunks(width)
+        self._woken = []
+
+    def __len__(self) -> int:
+        """Return the number of Raccoons in this roster."""
+        return len(self.tiles)
+
+    def copy(self) -> RaccoonRoster:
+        """Return a copy of this roster, which shares its data with this one
+        until either of them changes it.
+
+        >>> roster = RaccoonRoster(bytearray(4), 2)
+        >>> roster.add(3, object)
+        >>> other = roster.copy()
+        >>> other.moved(3, 1)
+        >>> roster.tiles, other.tiles
+        ([3], [1])
+        """
+        other = RaccoonRoster(self.blocked, 1)
+        other.tiles = self.tiles
+        other.kinds = self.kinds
+        other.trapped = self.trapped
+        other.in_can = self.in_can
+        other._ranks = self._ranks.copy()
+        other._active = self._active
+        other._sleeping = self._sleeping.copy()
+        other._woken = self._woken[:]
+        self._shared = other._shared = True
+        self._blocked_shared = other._blocked_shared = True
+        return other
+
+    def _own(self) -> None:
+        """Copy tiles, kinds and _active if they are shared, so that they
+        can be changed.
+        """
+        if self._shared:
+            self.tiles = self.tiles[:]
+            self.kinds = self.kinds[:]
+            self._active = self._active[:]
+            self._shared = False
+
+    def add(self, i: int, kind: type) -> None:
+        """Add a Raccoon of class <kind> on the tile at index <i> to the end
+        of the turn order.
+        """
+        self._own()
+        self._ranks[i] = len(self.tiles)
+        self._active.append(len(self.tiles))
+        self.tiles.append(i)
+        self.kinds.append(kind)
+
+    def kind(self, i: int) -> type:
+        """Return the class of the Raccoon on the tile at index <i>."""
+        return self.kinds[self._ranks[i]]
+
+    def moved(self, i: int, j: int) -> None:
+        """Record that the Raccoon on the tile at index <i> has moved to the
+        tile at index <j>.
+        """
+        self._own()
+        rank = self._ranks.pop(i)
+        self._ranks[j] = rank
+        self.tiles[rank] = j
+
+    def count(self, code: int, i: int, change: int) -> None:
+        """Add <change> to the trapped or inside-can count for the Raccoon on
+        the tile at index <i>, whose code is <code>, if there is one.
+        """
+        if code == IN_CAN_CODE:
+            self.in_can += change
+        elif code in FREE_RACCOON_CODES and self.blocked[i] == 4:
+            self.trapped += change
+
+    def block(self, tiles: List[int], change: int, codes: bytearray) -> None:
+        """Add <change> to the blocked neighbour counts of the tiles at the
+        indexes <tiles>, whose codes are in <codes>, and update the trapped
+        count. A sleeping Raccoon that is no longer trapped is woken.
+        """
+        if self._blocked_shared:
+            self.blocked = self.blocked.copy()
+            self._blocked_shared = False
+        blocked = self.blocked
+        for j in tiles:
+            was_trapped = blocked[j] == 4
+            blocked[j] += change
+            if codes[j] in FREE_RACCOON_CODES and \
+                    was_trapped != (blocked[j] == 4):
+                self.trapped += change
+                if was_trapped and j in self._sleeping:
+                    heappush(self._woken, self._sleeping.pop(j))
+
+    def turns(self) -> Iterator[int]:
+        """Yield the rank of every Raccoon to give a turn to in a step, in
+        order of rank.
+
+        These are the active Raccoons and the woken ones, including those
+        woken during the step. Each rank yielded must be passed to schedule
+        or keep before the next one is asked for; a Raccoon woken after its
+        rank has passed is visited in the next step instead.
+        """
+        active, woken = self._active, self._woken
+        # the Raccoons to visit next step; woken Raccoons that have already
+        # had their turn in this step are visited again in the next one
+        later = []
+        self._active = []
+        k, now = 0, -1
+        while True:
+            if woken and (k == len(active) or woken[0] < active[k]):
+                rank = heappop(woken)
+                if rank < now:
+                    heappush(later, rank)
+                    continue
+            elif k < len(active):
+                rank = active[k]
+                k += 1
+            else:
+                break
+            now = rank
+            yield rank
+        self._woken = later
+
+    def schedule(self, rank: int, codes: bytearray) -> None:
+        """Decide whether the Raccoon of rank <rank>, which has just had its
+        turn, is given a turn in the next step, from the tile codes <codes>.
+
+        It is left out if it is inside a GarbageCan, put to sleep if it is
+        trapped, and kept active otherwise.
+        """
+        i = self.tiles[rank]
+        if codes[i] == IN_CAN_CODE:
+            return
+        elif self.blocked[i] == 4:
+            self._sleeping[i] = rank
+        else:
+            self._active.append(rank)
+
+    def keep(self, rank: int) -> None:
+        """Give the Raccoon of rank <rank>, which has just had its turn, a
+        turn in the next step as well.
+        """
+        self._active.append(rank)
+
+    def memory_usage(self) -> int:
+        """Return roughly how many bytes this roster uses."""
+        return sum(map(sys.getsizeof, [
+            self.tiles, self.kinds, self.blocked, self._active,
+            self._woken])) + self._ranks.memory_usage() + \
+            self._sleeping.memory_usage()
+
+
+class BinClusters:
+    """The clusters of adjacent RecyclingBins on a board, labelled as the
+    bins move, so that the size of the largest one can be read without
+    searching the whole board.
+
+    When a tile gains or loses a RecyclingBin, only the clusters next to it
+    are dropped. They are labelled again, from the tiles that were left
+    dirty, the next time the largest size is asked for.
+
+    A copy shares the chunks of its labels and sizes with the original until
+    either of them changes one.
+    """
+    # === Private Attributes ===
+    # _width, _height:
+    #   the size of the board
+    # _labels:
+    #   the id of the cluster that the RecyclingBin on each tile (by index)
+    #   belongs to, in a chunk per board row. Labels may be out of date for
+    #   tiles whose cluster has been dropped; those tiles are reachable from
+    #   _dirty.
+    # _sizes:
+    #   the number of RecyclingBins in each cluster, by cluster id, in chunks
+    #   of as many ids as the board is wide
+    # _size_counts:
+    #   how many clusters there are of each size
+    # _dirty:
+    #   tile indexes to label clusters from again before a size is read
+    # _next_id:
+    #   the id to give the next cluster that is labelled
+
+    _width: int
+    _height: int
+    _labels: SharedChunks
+    _sizes: SharedChunks
+    _size_counts: Dict[int, int]
+    _dirty: Set[int]
+    _next_id: int
+
+    def __init__(self, w: int, h: int) -> None:
+        """Initialize the clusters of a board of width <w> and height <h>
+        that has no RecyclingBins.
+        """
+        self._width = w
+        self._height = h
+        self._labels = SharedChunks(w)
+        self._sizes = SharedChunks(w)
+        self._size_counts = {}
+        self._dirty = set()
+        self._next_id = 0
+
+    def copy(self) -> BinClusters:
+        """Return a copy of these clusters, which shares its labels and sizes
+        with these until either of them changes them.
+        """
+        other = BinClusters(self._width, self._height)
+        other._labels = self._labels.copy()
+        other._sizes = self._sizes.copy()
+        other._size_counts = self._size_counts.copy()
+        other._dirty = self._dirty.copy()
+        other._next_id = self._next_id
+        return other
+
+    def add(self, i: int) -> None:
+        """Record that the tile at index <i> has gained a RecyclingBin, for
+        loading a board in bulk, before any of its clusters are labelled.
+        """
+        self._dirty.add(i)
+
+    def changed(self, i: int, added: bool, codes: bytearray) -> None:
+        """Record that the tile at index <i> has gained a RecyclingBin if
+        <added>, or lost one otherwise, where <codes> are the board's tile
+        codes.
+        """
+        if added:
+            self._dirty.add(i)
+        else:
+            self._drop(self._labels.pop(i, None))
+        for j in neighbours(i, self._width, self._height):
+            if codes[j] == BIN_CODE:
+                self._drop(self._labels.get(j))
+                if not added:
+                    self._dirty.add(j)
+
+    def largest(self, codes: bytearray) -> int:
+        """Return the size of the largest cluster, or 0 if there are no
+        RecyclingBins, where <codes> are the board's tile codes.
+
+        Each cluster left dirty is labelled again with an iterative search,
+        so only the clusters that changed since the last call are visited.
+
+        >>> clusters = BinClusters(3, 2)
+        >>> codes = bytearray(b'B-BB-B')
+        >>> for i in [0, 2, 3, 5]:
+        ...     clusters.add(i)
+        >>> clusters.largest(codes)
+        2
+        >>> codes[4] = BIN_CODE
+        >>> clusters.changed(4, True, codes)
+        >>> clusters.largest(codes)
+        5
+        """
+        first = self._next_id
+        for start in self._dirty:
+            label = self._labels.get(start)
+            if codes[start] != BIN_CODE or \
+                    (label is not None and label >= first):
+                continue  # no longer a bin, or already labelled below
+            cluster = self._next_id
+            self._next_id += 1
+            self._drop(label)
+            self._labels[start] = cluster
+            size = 0
+            to_visit = [start]
+            while to_visit:
+                i = to_visit.pop()
+                size += 1
+                for j in neighbours(i, self._width, self._height):
+                    if codes[j] == BIN_CODE:
+                        label = self._labels.get(j)
+                        if label is None or label < first:
+                            self._drop(label)
+                            self._labels[j] = cluster
+                            to_visit.append(j)
+            self._sizes[cluster] = size
+            self._size_counts[size] = self._size_counts.get(size, 0) + 1
+        self._dirty = set()
+        return max(self._size_counts, default=0)
+
+    def _drop(self, cluster: Optional[int]) -> None:
+        """Stop counting the cluster with id <cluster>, if it is counted."""
+        if cluster is not None and cluster in self._sizes:
+            size = self._sizes.pop(cluster)
+            self._size_counts[size] -= 1
+            if self._size_counts[size] == 0:
+                del self._size_counts[size]
+
+    def memory_usage(self) -> int:
+        """Return roughly how many bytes these clusters use."""
+        return self._labels.memory_usage() + self._sizes.memory_usage() + \
+            sys.getsizeof(self._size_counts) + sys.getsizeof(self._dirty)
+
+
+class SightStops:
+    """The tiles of a board that end a SmartRaccoon's line of sight (see
+    SIGHT_STOP_CODES), sorted by row and by column, so that the nearest one
+    in any direction is found with a binary search.
+
+    A copy shares the stops of each row and column with the original until
+    either of them changes that row or column.
+
+    >>> stops = SightStops()
+    >>> stops.add(4, 0)
+    >>> stops.add(1, 0)
+    >>> stops.nearest(2, 0, (1, 0)), stops.nearest(2, 0, (-1, 0))
+    (2, 1)
+    >>> stops.remove(4, 0)
+    >>> stops.nearest(2, 0, (1, 0)), stops.nearest(1, 3, (0, -1))
+    (-1, 3)
+    """
+    # === Private Attributes ===
+    # _rows:
+    #   for each row, the sorted x coordinates of its stops. Rows with no
+    #   stops have no entry.
+    # _cols:
+    #   for each column, the sorted y coordinates of its stops. Columns with
+    #   no stops have no entry.
+    # _owned_rows, _owned_cols:
+    #   the rows and the columns whose lists are not shared with a copy of
+    #   this index (or the index this one was copied from), which can be
+    #   changed in place
+
+    _rows: Dict[int, List[int]]
+    _cols: Dict[int, List[int]]
+    _owned_rows: Set[int]
+    _owned_cols: Set[int]
+
+    def __init__(self) -> None:
+        """Initialize an index with no stops."""
+        self._rows = {}
+        self._cols = {}
+        self._owned_rows = set()
+        self._owned_cols = set()
+
+    def copy(self) -> SightStops:
+        """Return a copy of this index, which shares the stops of each row
+        and column with this one until either of them changes them.
+
+        >>> stops = SightStops()
+        >>> stops.add(1, 0)
+        >>> other = stops.copy()
+        >>> other.add(3, 0)
+        >>> stops.row(0), other.row(0)
+        ([1], [1, 3])
+        """
+        other = SightStops()
+        other._rows = self._rows.copy()
+        other._cols = self._cols.copy()
+        self._owned_rows = set()
+        self._owned_cols = set()
+        return other
+
+    def add(self, x: int, y: int) -> None:
+        """Add tile (x, y) as a stop."""
+        insort(_own_line(self._rows, self._owned_rows, y), x)
+        insort(_own_line(self._cols, self._owned_cols, x), y)
+
+    def append(self, x: int, y: int) -> None:
+        """Add tile (x, y) as a stop, for loading a board in bulk.
+
+        Precondition:
+        - every stop added so far comes before (x, y), row by row
+        """
+        _own_line(self._rows, self._owned_rows, y).append(x)
+        _own_line(self._cols, self._owned_cols, x).append(y)
+
+    def remove(self, x: int, y: int) -> None:
+        """Remove tile (x, y), which is a stop."""
+        for lines, owned, line, pos in [(self._rows, self._owned_rows, y, x),
+                                        (self._cols, self._owned_cols, x, y)]:
+            stops = _own_line(lines, owned, line)
+            stops.remove(pos)
+            if not stops:
+                del lines[line]
+                owned.discard(line)
+
+    def row(self, y: int) -> List[int]:
+        """Return the sorted x coordinates of the stops in row <y>."""
+        return self._rows.get(y, [])
+
+    def nearest(self, x: int, y: int, direction: Tuple[int, int]) -> int:
+        """Return how many tiles away from tile (x, y) the nearest stop in
+        <direction> is, or -1 if there is none.
+
+        Precondition:
+        - direction is one of the four directions (left, up, right, down)
+        """
+        if direction[1] == 0:
+            stops, start, step = self._rows.get(y, []), x, direction[0]
+        else:
+            stops, start, step = self._cols.get(x, []), y, direction[1]
+        if step > 0:
+            k = bisect_right(stops, start)
+        else:
+            k = bisect_left(stops, start) - 1
+        if k < 0 or k == len(stops):
+            return -1
+        return abs(stops[k] - start)
+
+    def memory_usage(self) -> int:
+        """Return roughly how many bytes this index uses."""
+        return sum(sys.getsizeof(lines) + sum(map(sys.getsizeof,
+                                                  lines.values()))
+                   for lines in [self._rows, self._cols])
+
+
+def read_level(lines: Iterable[str]) -> Tuple[int, bytearray]:
+    """Return the width and the tile codes, row by row, of the level in
+    <lines>, which has one board row per line, written with the chars in
+    LEVEL_CHARS.
+
+    Line endings are ignored, as are blank lines before the first row and
+    after the last row.
+
+    Raise a ValueError that names the line if a line contains a char that is
+    not in the level format or is not as long as the first line.
+
+    >>> read_level(['\\n', 'P-B\\n', 'R--\\n'])
+    (3, bytearray(b'P-BR--'))
+    """
+    codes = bytearray()
+    width = None
+    blank = None
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip('\r\n')
+        if not line:
+            if width is not None:
+                blank = blank or number
+            continue
+        if blank is not None:
+            raise ValueError(f'line {blank}: blank line inside the level')
+        if width is None:
+            width = len(line)
+        elif len(line) != width:
+            raise ValueError(f'line {number}: expected {width} tiles but '
+                             f'found {len(line)}')
+        if not LEVEL_CHARS.issuperset(line):
+            for column, char in enumerate(line, 1):
+                if char not in LEVEL_CHARS:
+                    raise ValueError(f'line {number}, column {column}: '
+                                     f'unknown tile {char!r}')
+        codes += line.encode()
+    if width is None:
+        raise ValueError('the level has no rows')
+    return width, codes
+
+
+def neighbours(i: int, width: int, height: int) -> List[int]:
+    """Return the indexes of the neighbours of the tile at index <i> of a
+    board of width <width> and height <height> that are on the board, in the
+    order left, up, right, down.
+
+    >>> neighbours(4, 3, 3)
+    [3, 1, 5, 7]
+    >>> neighbours(0, 3, 2)
+    [1, 3]
+    """
+    x = i % width
+    rslt = []
+    if x > 0:
+        rslt.append(i - 1)
+    if i >= width:
+        rslt.append(i - width)
+    if x < width - 1:
+        rslt.append(i + 1)
+    if i < (height - 1) * width:
+        rslt.append(i + width)
+    return rslt
+
+
+def occupied(codes: bytes) -> Iterator[Tuple[int, int]]:
+    """Return the index and code of every tile in the bytes-like tile codes
+    <codes> that is not empty, in order of index.
+
+    >>> list(occupied(b'-R--P'))
+    [(1, 82), (4, 80)]
+    """
+    return ((match.start(), codes[match.start()])
+            for match in OCCUPIED.finditer(codes))
+
+
+def _own_line(lines: Dict[int, List[int]], owned: Set[int],
+              line: int) -> List[int]:
+    """Return the stops of <line> in <lines>, the rows or the columns of a
+    SightStops, first copying them if <line> is not in <owned>, so that they
+    can be changed.
+    """
+    stops = lines.get(line)
+    if stops is None:
+        stops = lines[line] = []
+        owned.add(line)
+    elif line not in owned:
+        stops = lines[line] = stops[:]
+        owned.add(line)
+    return stops
+
+
+def tile_key(i: int, code: int) -> int:
+    """Return the key of tile code <code> at index <i> of a board's grid,
+    which TileGrid.state_hash is made from.
+
+    The keys look random, but are computed from <i> and <code> (with the
+    splitmix64 mixing function) instead of being stored, so they are the same
+    on every board and take no memory. An empty tile's key is 0.
+    """
+    if code == EMPTY_CODE:
+        return 0
+    z = ((i << 8 | code) * 0x9E3779B97F4A7C15) & HASH_MASK
+    z = ((z ^ z >> 30) * 0xBF58476D1CE4E5B9) & HASH_MASK
+    z = ((z ^ z >> 27) * 0x94D049BB133111EB) & HASH_MASK
+    return z ^ z >> 31
+
+
+class SharedChunks:
+    """A dictionary with int keys, stored in chunks of consecutive keys,
+    whose copies share its chunks: a chunk is only copied the first time it
+    is changed after the dictionary has been copied.
+
+    The indexes that a board keeps by tile use a chunk per board row, so
+    that cloning the board takes time in its number of rows, and each move
+    copies only the rows that it changes.
+
+    >>> a = SharedChunks(4)
+    >>> a[1], a[6] = 'x', 'y'
+    >>> b = a.copy()
+    >>> b[6] = 'z'
+    >>> a.get(6), b.get(6), b.pop(1), 1 in a, 1 in b
+    ('y', 'z', 'x', True, False)
+    """
+    # === Private Attributes ===
+    # _size:
+    #   the number of keys in each chunk, so that key k is in chunk k // _size
+    # _chunks:
+    #   the entries of each chunk that has had any, keyed by chunk number
+    # _owned:
+    #   the numbers of the chunks that are not shared with a copy of this
+    #   dictionary (or the dictionary this one was copied from), which can be
+    #   changed in place
+
+    _size: int
+    _chunks: Dict[int, Dict[int, object]]
+    _owned: Set[int]
+
+    def __init__(self, size: int) -> None:
+        """Initialize an empty dictionary with <size> keys in each chunk."""
+        self._size = size
+        self._chunks = {}
+        self._owned = set()
+
+    def copy(self) -> SharedChunks:
+        """Return a copy of this dictionary, which shares every chunk with
+        this one until either of them changes it.
+        """
+        other = SharedChunks(self._size)
+        other._chunks = self._chunks.copy()
+        self._owned = set()
+        return other
+
+    def __contains__(self, key: int) -> bool:
+        """Return whether <key> is in this dictionary."""
+        chunk = self._chunks.get(key // self._size)
+        return chunk is not None and key in chunk
+
+    def __getitem__(self, key: int) -> object:
+        """Return the value of <key>, which is in this dictionary."""
+        return self._chunks[key // self._size][key]
+
+    def get(self, key: int, default: object = None) -> object:
+        """Return the value of <key>, or <default> if it has none."""
+        chunk = self._chunks.get(key // self._size)
+        return default if chunk is None else chunk.get(key, default)
+
+    def __setitem__(self, key: int, value: object) -> None:
+        """Set the value of <key> to <value>."""
+        self._own_chunk(key // self._size)[key] = value
+
+    def pop(self, key: int, default: object = None) -> object:
+        """Remove <key> and return its value, or return <default> if it is
+        not in this dictionary.
+        """
+        return self._own_chunk(key // self._size).pop(key, default)
+
+    def _own_chunk(self, k: int) -> Dict[int, object]:
+        """Return chunk number <k>, first copying it if it is shared."""
+        if k in self._owned:
+            return self._chunks[k]
+        chunk = self._chunks[k] = dict(self._chunks.get(k, {}))
+        self._owned.add(k)
+        return chunk
+
+    def memory_usage(self) -> int:
+        """Return roughly how many bytes this dictionary uses."""
+        return sys.getsizeof(self._chunks) + \
+            sum(map(sys.getsizeof, self._chunks.values()))
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   '__future__', 'bisect', 'heapq', 're',
+                                   'sys', 'racoon_raiders_src'],
+        'disable': ['E1136'],
+    })
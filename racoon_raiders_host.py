@@ -0,0 +1,409 @@
+"""Raccoon Raiders: game host
+
+=== Module Description ===
+This module serves many games of Raccoon Raiders from one process. Each
+client that connects (over TCP or a Unix socket) gets its own GameBoard, and
+a single tick scheduler gives every game a turn on each tick.
+
+Clients and the host exchange lines of text. A client sends:
+    L, U, R or D   to move the Player left, up, right or down
+    S              to ask for the board
+    Q              to leave
+and the host sends:
+    WELCOME <id>           when the client connects
+    TURN <turns>           after the turn in which a move was made
+    BOARD <rows>           in answer to S, with the rows separated by '/'
+    END <score>            when the game ends, after which it is closed
+    ERROR <message>        in answer to a line it does not understand
+
+Moves are queued and one is made per turn. Each game's queue holds at most a
+few moves, and the host stops reading from a client whose queue is full, so
+a client that sends faster than the game runs is slowed down by its own
+connection instead of using more and more memory. Likewise, the host stops
+reading from a client that is not reading what it has been sent, so the
+replies waiting to be sent to it are bounded too, and TURN lines are not
+sent to it at all.
+
+A game on a huge board can take much longer than a tick to play a turn. So
+that it cannot stall the other games, such a game (one whose last turn took
+longer than the tick budget, or whose board has at least LARGE_BOARD tiles)
+plays its turns in a worker thread, one at a time, while the event loop goes
+on serving the other games. Each tick also only plays games for up to the
+tick interval (picking up where the last tick left off), and a game whose
+turn took longer than its budget sits out a number of ticks in proportion,
+which slows down only that game.
+
+Turns played in worker threads still share one CPU with the rest of the
+host, as only one thread runs Python code at a time. Python switches between
+threads every few milliseconds, so the other games are delayed by that much
+rather than by the whole turn, but they run more slowly while it is played.
+To use more CPUs, run more hosts, each in its own process.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from racoon_raiders_src import DOWN, LEFT, RIGHT, UP, GameBoard
+
+# The direction of each move a client can send
+MOVES = {'L': LEFT, 'U': UP, 'R': RIGHT, 'D': DOWN}
+
+# By default: the seconds between ticks, how many moves a game can have
+# queued, and the seconds a game's turn may take before it sits out ticks
+DEFAULT_TICK_INTERVAL = 0.05
+DEFAULT_QUEUE_SIZE = 8
+DEFAULT_TICK_BUDGET = 0.005
+
+# Boards with at least this many tiles always play their turns in a worker
+# thread, even before one of their turns has been timed
+LARGE_BOARD = 250_000
+
+# How many bytes may be waiting to be sent to a client before TURN lines
+# are no longer sent to it, and no more lines are read from it
+WRITE_LIMIT = 64 * 1024
+
+
+class Session:
+    """One game being played on a GameHost.
+
+    === Public Attributes ===
+    id:
+        the number of this session, unique on its host
+    board:
+        the board of this session's game
+    commands:
+        the lines the client has sent that have not been handled yet
+    writer:
+        the connection to the client
+    idle_ticks:
+        how many more ticks this session sits out, because its last turn
+        took longer than its host's tick budget
+    turn_seconds:
+        how long this session's last turn took
+    busy:
+        whether a turn of this session is being played in a worker thread
+    """
+    id: int
+    board: GameBoard
+    commands: asyncio.Queue
+    writer: asyncio.StreamWriter
+    idle_ticks: int
+    turn_seconds: float
+    busy: bool
+
+    def __init__(self, session_id: int, board: GameBoard,
+                 writer: asyncio.StreamWriter, queue_size: int) -> None:
+        """Initialize a session numbered <session_id> that plays on <board>
+        for the client connected through <writer>.
+        """
+        self.id = session_id
+        self.board = board
+        self.commands = asyncio.Queue(queue_size)
+        self.writer = writer
+        self.idle_ticks = 0
+        self.turn_seconds = 0.0
+        self.busy = False
+
+    def send(self, line: str, urgent: bool = True) -> None:
+        """Send <line> to the client, unless it is not <urgent> and the
+        client is not keeping up with what it has already been sent.
+        """
+        if self.writer.is_closing():
+            return
+        if urgent or \
+                self.writer.transport.get_write_buffer_size() < WRITE_LIMIT:
+            self.writer.write(line.encode() + b'\n')
+
+
+class GameHost:
+    """A host of many games in one process, driven by one tick scheduler.
+
+    === Public Attributes ===
+    sessions:
+        the games being played, by session id
+    tick_interval:
+        the seconds between ticks
+    tick_budget:
+        the seconds a game's turn may take on the event loop; a game whose
+        turns take longer plays them in a worker thread and sits out ticks
+    """
+    sessions: Dict[int, Session]
+    tick_interval: float
+    tick_budget: float
+    # === Private Attributes ===
+    # _new_board:
+    #   makes the board for the session with the given id
+    # _queue_size:
+    #   how many lines a session can have waiting to be handled
+    # _next_id:
+    #   the id of the next session
+    # _order:
+    #   the ids of the sessions, in the order the scheduler visits them
+    # _cursor:
+    #   the index in _order of the next session to play a turn
+    # _servers:
+    #   the servers that clients connect to
+    # _running:
+    #   whether the tick scheduler should keep running
+    # _threaded:
+    #   the tasks waiting for turns being played in worker threads
+    _new_board: Callable[[int], GameBoard]
+    _queue_size: int
+    _next_id: int
+    _order: List[int]
+    _cursor: int
+    _servers: List[asyncio.AbstractServer]
+    _running: bool
+    _threaded: Set[asyncio.Task]
+
+    def __init__(self, new_board: Callable[[int], GameBoard],
+                 tick_interval: float = DEFAULT_TICK_INTERVAL,
+                 queue_size: int = DEFAULT_QUEUE_SIZE,
+                 tick_budget: float = DEFAULT_TICK_BUDGET) -> None:
+        """Initialize a host whose session with id i plays on the board
+        made by new_board(i).
+        """
+        self.sessions = {}
+        self.tick_interval = tick_interval
+        self.tick_budget = tick_budget
+        self._new_board = new_board
+        self._queue_size = queue_size
+        self._next_id = 0
+        self._order = []
+        self._cursor = 0
+        self._servers = []
+        self._running = False
+        self._threaded = set()
+
+    async def serve_tcp(self, host: str = '127.0.0.1',
+                        port: int = 0) -> asyncio.AbstractServer:
+        """Start accepting clients on TCP <port> of <host> (any free port
+        if <port> is 0), and return the server.
+        """
+        server = await asyncio.start_server(self._serve, host, port)
+        self._servers.append(server)
+        return server
+
+    async def serve_unix(self, path: str) -> asyncio.AbstractServer:
+        """Start accepting clients on the Unix socket at <path>, and return
+        the server.
+        """
+        server = await asyncio.start_unix_server(self._serve, path)
+        self._servers.append(server)
+        return server
+
+    async def run(self) -> None:
+        """Run the tick scheduler until stop is called."""
+        self._running = True
+        while self._running:
+            start = perf_counter()
+            await self.tick()
+            await asyncio.sleep(max(0.0, self.tick_interval -
+                                    (perf_counter() - start)))
+
+    def stop(self) -> None:
+        """Stop the tick scheduler and every server, and close every
+        session.
+        """
+        self._running = False
+        for server in self._servers:
+            server.close()
+        for session_id in list(self.sessions):
+            self._close(session_id)
+
+    async def tick(self) -> None:
+        """Give each session a turn, for up to tick_interval seconds.
+
+        Sessions are visited in turn, starting after the last one visited by
+        the previous tick, and the event loop is given a chance to handle
+        input after each turn. Sessions may be closed meanwhile, so the tick
+        ends early if none are left. Sessions whose turn is being played in a
+        worker thread are skipped.
+        """
+        start = perf_counter()
+        for _ in range(len(self._order)):
+            if not self._order or perf_counter() - start >= self.tick_interval:
+                break
+            self._cursor %= len(self._order)
+            session = self.sessions[self._order[self._cursor]]
+            self._cursor += 1
+            if session.busy:
+                continue
+            if session.idle_ticks:
+                session.idle_ticks -= 1
+                continue
+            self._play_turn(session)
+            await asyncio.sleep(0)
+
+    def _play_turn(self, session: Session) -> None:
+        """Play one turn of <session>, in a worker thread if its turns take
+        too long to be played on the event loop.
+
+        Every S line waiting before the first waiting move is answered, and
+        that move is made.
+        """
+        move = None
+        shows = 0
+        while move is None and not session.commands.empty():
+            command = session.commands.get_nowait()
+            if command == 'S':
+                shows += 1
+            else:
+                move = MOVES[command]
+        board = session.board
+        if session.turn_seconds > self.tick_budget or \
+                board.width * board.height >= LARGE_BOARD:
+            session.busy = True
+            task = asyncio.create_task(self._play_threaded(session, move,
+                                                           shows))
+            self._threaded.add(task)
+            task.add_done_callback(self._threaded.discard)
+        else:
+            start = perf_counter()
+            replies = play_turn(board, move, shows)
+            self._finish_turn(session, replies, perf_counter() - start)
+
+    async def _play_threaded(self, session: Session,
+                             move: Optional[Tuple[int, int]],
+                             shows: int) -> None:
+        """Play one turn of <session> in a worker thread, as in play_turn,
+        and then send its replies.
+        """
+        start = perf_counter()
+        try:
+            replies = await asyncio.to_thread(play_turn, session.board, move,
+                                              shows)
+        finally:
+            session.busy = False
+        self._finish_turn(session, replies, perf_counter() - start)
+
+    def _finish_turn(self, session: Session, replies: List[Tuple[str, bool]],
+                     took: float) -> None:
+        """Record that the turn of <session> that gave <replies> took <took>
+        seconds, send the replies, and close the session if its game ended.
+        """
+        session.turn_seconds = took
+        session.idle_ticks = int(took / self.tick_budget)
+        if session.id not in self.sessions:
+            return
+        for line, urgent in replies:
+            session.send(line, urgent)
+        if session.board.ended:
+            self._close(session.id)
+
+    async def _serve(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Play a game with the client connected through <reader> and
+        <writer>, until it leaves or the game ends.
+        """
+        session_id = self._next_id
+        self._next_id += 1
+        session = Session(session_id, self._new_board(session_id), writer,
+                          self._queue_size)
+        self.sessions[session_id] = session
+        self._order.append(session_id)
+        writer.transport.set_write_buffer_limits(high=WRITE_LIMIT)
+        session.send(f'WELCOME {session_id}')
+        try:
+            while session_id in self.sessions:
+                # waits while too much is waiting to be sent, so no more
+                # replies are asked for
+                await writer.drain()
+                line = await reader.readline()
+                command = line.decode(errors='replace').strip().upper()
+                if not line or command == 'Q':
+                    break
+                elif command in MOVES or command == 'S':
+                    # waits while the queue is full, so no more is read
+                    await session.commands.put(command)
+                elif command:
+                    session.send(f'ERROR unknown command {command!r}')
+        except ConnectionError:
+            pass
+        finally:
+            self._close(session_id)
+
+    def _close(self, session_id: int) -> None:
+        """Remove the session with id <session_id>, if it has not been
+        removed already, and close its connection.
+        """
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        index = self._order.index(session_id)
+        del self._order[index]
+        if index < self._cursor:
+            self._cursor -= 1
+        session.writer.close()
+
+
+def play_turn(board: GameBoard, move: Optional[Tuple[int, int]],
+              shows: int) -> List[Tuple[str, bool]]:
+    """Play one turn on <board> in which the Player makes <move> (None for
+    no move), after answering <shows> S lines, and return the lines to send
+    to the client, each with whether it is urgent (see Session.send).
+
+    This only uses <board>, so it can be run in a worker thread.
+
+    >>> from racoon_raiders_src import RIGHT
+    >>> b = GameBoard(1, 1)
+    >>> b.setup_from_grid('PB-R')
+    >>> play_turn(b, RIGHT, 1)
+    [('BOARD PB-R', True), ('TURN 1', False), ('END 11', True)]
+    """
+    replies = [('BOARD ' + str(board).replace('\n', '/'), True)] * shows
+    if move is not None:
+        board.handle_event(move)
+    board.give_turns()
+    if move is not None:
+        replies.append((f'TURN {board.turns}', False))
+    if board.ended:
+        replies.append((f'END {board.check_game_end()}', True))
+    return replies
+
+
+def level_boards(grid: str, seed: int = 0,
+                 board_type: type = GameBoard) \
+        -> Callable[[int], GameBoard]:
+    """Return a function that makes the board for a session of a GameHost:
+    a board of type <board_type> with the level <grid>, and the seed
+    <seed> plus the session's id.
+
+    >>> new_board = level_boards('P-R')
+    >>> print(new_board(0))
+    P-R
+    >>> new_board(3).seed
+    3
+    """
+    def new_board(session_id: int) -> GameBoard:
+        board = board_type(1, 1, seed + session_id)
+        board.setup_from_grid(grid)
+        return board
+    return new_board
+
+
+async def _demo(grid: str, port: int) -> None:
+    """Serve games of the level <grid> on TCP <port> until interrupted."""
+    host = GameHost(level_boards(grid))
+    await host.serve_tcp(port=port)
+    await host.run()
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   '__future__', 'asyncio', 'time',
+                                   'racoon_raiders_src'],
+        'disable': ['E1136'],
+    })
+
+    asyncio.run(_demo('P-B--R-R\nOBRB-OSC\nR-BBC-RS\n-C-S--R-\nR-O-BB-R',
+                      8148))
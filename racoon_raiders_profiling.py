@@ -0,0 +1,207 @@
+"""Raccoon Raiders: profiling
+
+=== Module Description ===
+This module measures where the time goes in a game of Raccoon Raiders. A
+BoardProfiler counts the calls to, and times, the main phases of the game on
+one GameBoard, records how many RecyclingBins each push moves, and reports
+how much memory the board uses.
+
+A board is only slowed down while it is being profiled: starting a profiler
+puts timed wrappers around the board's own methods, and stopping it removes
+them again, so a board that is not being profiled runs exactly the same code
+as before.
+"""
+
+from __future__ import annotations
+
+from time import perf_counter
+from typing import Any, Callable, Dict, Tuple
+
+from racoon_raiders_src import GameBoard
+
+# The phases that are timed, and the GameBoard method that each one times.
+# The player phase is the part of give_turns outside of the raccoons' turns
+# and the end check. Phases that call each other, such as the end check and
+# bin scoring, are each timed in full.
+PHASES = {
+    'turn': 'give_turns',
+    'raccoons': 'step_raccoons',
+    'end_check': 'check_game_end',
+    'bin_score': 'adjacent_bin_score',
+    'grid': 'to_grid',
+}
+PLAYER_PHASE = 'player'
+
+
+class BoardProfiler:
+    """A profiler of the game on one GameBoard.
+
+    A profiler can be started and stopped any number of times, and its counts
+    keep adding up until reset is called. It can also be used as a context
+    manager, which profiles the board inside the with block.
+
+    === Public Attributes ===
+    board:
+        the board being profiled
+    calls:
+        how many times each phase (see PHASES and PLAYER_PHASE) has run
+    seconds:
+        the total time each phase has taken
+    push_chains:
+        how many times the Player has pushed each number of RecyclingBins at
+        once, keyed by the number of bins
+
+    === Sample Usage ===
+    >>> from racoon_raiders_src import RIGHT
+    >>> b = GameBoard(1, 1)
+    >>> b.setup_from_grid('PBB-\\n---R')
+    >>> with BoardProfiler(b) as profiler:
+    ...     b.play_events([RIGHT] * 3)
+    3
+    >>> profiler.calls['turn']
+    3
+    >>> profiler.push_chains
+    {2: 1}
+    """
+    board: GameBoard
+    calls: Dict[str, int]
+    seconds: Dict[str, float]
+    push_chains: Dict[int, int]
+    # === Private Attributes ===
+    # _running:
+    #   whether this profiler's wrappers are installed on the board
+    # _bins_moved:
+    #   how many RecyclingBins have been pushed during the current turn
+    _running: bool
+    _bins_moved: int
+
+    def __init__(self, board: GameBoard) -> None:
+        """Initialize a profiler of <board>, which is not started."""
+        self.board = board
+        self._running = False
+        self._bins_moved = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget everything this profiler has measured."""
+        self.calls = {phase: 0 for phase in list(PHASES) + [PLAYER_PHASE]}
+        self.seconds = {phase: 0.0 for phase in self.calls}
+        self.push_chains = {}
+
+    def start(self) -> None:
+        """Start profiling the board.
+
+        Raise a ValueError if the board is already being profiled.
+        """
+        if self._running or any(name in vars(self.board)
+                                for name in PHASES.values()):
+            raise ValueError('this board is already being profiled')
+        for phase, name in PHASES.items():
+            if phase != 'turn':
+                setattr(self.board, name,
+                        self._timed(phase, getattr(self.board, name)))
+        self.board.give_turns = self._timed_turn(self.board.give_turns)
+        self.board.shift_bins = self._counted_shift(self.board.shift_bins)
+        self._running = True
+
+    def stop(self) -> None:
+        """Stop profiling the board, if it is being profiled."""
+        if self._running:
+            for name in list(PHASES.values()) + ['shift_bins']:
+                delattr(self.board, name)
+            self._running = False
+
+    def __enter__(self) -> BoardProfiler:
+        """Start profiling the board, and return this profiler."""
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Stop profiling the board."""
+        self.stop()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return everything this profiler has measured, and the board's
+        current turn and memory use, as a dictionary of plain values that
+        can be written out as JSON.
+
+        >>> b = GameBoard(1, 1)
+        >>> b.setup_from_grid('P-R')
+        >>> profiler = BoardProfiler(b)
+        >>> sorted(profiler.snapshot())
+        ['memory', 'phases', 'push_chains', 'turns']
+        """
+        return {
+            'turns': self.board.turns,
+            'memory': self.board.memory_usage(),
+            'phases': {phase: {'calls': self.calls[phase],
+                               'seconds': self.seconds[phase]}
+                       for phase in self.calls},
+            'push_chains': {str(length): count for length, count
+                            in sorted(self.push_chains.items())},
+        }
+
+    def _timed(self, phase: str, method: Callable) -> Callable:
+        """Return a wrapper of <method> that counts and times its calls as
+        <phase>.
+        """
+        calls, seconds = self.calls, self.seconds
+
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                seconds[phase] += perf_counter() - start
+                calls[phase] += 1
+        return timed
+
+    def _timed_turn(self, give_turns: Callable) -> Callable:
+        """Return a wrapper of the board's give_turns method that also times
+        the Player's part of the turn and records the bins it pushed.
+        """
+        calls, seconds = self.calls, self.seconds
+
+        def timed_turn() -> None:
+            self._bins_moved = 0
+            others = seconds['raccoons'] + seconds['end_check']
+            start = perf_counter()
+            try:
+                give_turns()
+            finally:
+                took = perf_counter() - start
+                seconds['turn'] += took
+                calls['turn'] += 1
+                others = seconds['raccoons'] + seconds['end_check'] - others
+                seconds[PLAYER_PHASE] += took - others
+                calls[PLAYER_PHASE] += 1
+                if self._bins_moved:
+                    self.push_chains[self._bins_moved] = \
+                        self.push_chains.get(self._bins_moved, 0) + 1
+        return timed_turn
+
+    def _counted_shift(self, shift_bins: Callable) -> Callable:
+        """Return a wrapper of the board's shift_bins method that counts how
+        many RecyclingBins are pushed.
+
+        Only the Player pushes RecyclingBins, so the bins pushed during a turn
+        are the length of that turn's push chain.
+        """
+        def counted_shift(x: int, y: int, direction: Tuple[int, int],
+                          n: int) -> None:
+            self._bins_moved += n
+            shift_bins(x, y, direction, n)
+        return counted_shift
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   '__future__', 'time', 'racoon_raiders_src'],
+        'disable': ['E1136'],
+    })
@@ -0,0 +1,237 @@
+"""Raccoon Raiders: game recordings
+
+=== Module Description ===
+This module records games of Raccoon Raiders compactly, so that they can be
+saved and replayed exactly. A GameRecord starts a board that adds every event
+it handles to the recording, and encodes the recording as bytes, with most
+events taking one byte each.
+"""
+
+from __future__ import annotations
+
+import struct
+from typing import List, Optional, Tuple
+
+from racoon_raiders_src import DIRECTIONS, SEED_MASK, GameBoard
+
+# The first bytes of every GameRecord encoded by GameRecord.to_bytes
+RECORD_MAGIC = b'RRG3'
+
+# The layout of the header of every encoded GameRecord: the magic, the seed,
+# whether it is finished, the number of turns, the lengths of the grid and
+# final board, and the number of events
+RECORD_HEADER = struct.Struct('<4sQ?IIII')
+
+
+class GameRecord:
+    """A compact recording of a game, from which it can be replayed exactly.
+
+    A game is fully determined by its starting level, the seed of its board's
+    random number generator, and the events handled by the board on each
+    turn, so only these are recorded, along with the final board to check a
+    replay against.
+
+    === Public Attributes ===
+    grid:
+        the starting level, in the format used by GameBoard.setup_from_grid
+    seed:
+        the seed of the board's random number generator, from 0 to
+        2 ** 64 - 1
+    events:
+        every event handled, as (turn, index in DIRECTIONS) pairs, where turn
+        is the number of turns that had passed when the event was handled
+    turns:
+        the number of turns played when the recording was finished
+    final:
+        the board as a string when the recording was finished, or None if
+        it has not been finished
+
+    === Representation Invariants ===
+    The turns in events never decrease, and are all at most turns.
+
+    === Sample Usage ===
+    >>> from racoon_raiders_src import RIGHT
+    >>> record = GameRecord('P--\\n-BR\\n--B', 7)
+    >>> b = record.start()
+    >>> b.handle_event(RIGHT)
+    >>> b.give_turns()
+    >>> b.handle_event(RIGHT)
+    >>> b.give_turns()
+    >>> record.finish(b)
+    >>> record.events
+    [(0, 2), (1, 2)]
+    >>> copy = GameRecord.from_bytes(record.to_bytes())
+    >>> copy.verify()
+    True
+    """
+    grid: str
+    seed: int
+    events: List[Tuple[int, int]]
+    turns: int
+    final: Optional[str]
+
+    def __init__(self, grid: str, seed: int) -> None:
+        """Initialize an empty recording of a game of <grid> played with the
+        random number generator seeded with <seed>, which is reduced to its
+        lowest 64 bits as GameBoard does.
+
+        >>> GameRecord('P-R', -1).seed == 2 ** 64 - 1
+        True
+        """
+        self.grid = grid
+        self.seed = seed & SEED_MASK
+        self.events = []
+        self.turns = 0
+        self.final = None
+
+    def start(self, board_type: type = GameBoard) -> GameBoard:
+        """Return a new board of type <board_type> set up to play the recorded
+        game, that adds the events it handles to this recording.
+        """
+        board = self.new_board(board_type)
+        board.record = self
+        return board
+
+    def new_board(self, board_type: type = GameBoard) -> GameBoard:
+        """Return a new board of type <board_type> in the recorded game's
+        starting state.
+        """
+        board = board_type(1, 1, self.seed)
+        board.setup_from_grid(self.grid)
+        return board
+
+    def add_event(self, turn: int, event: Tuple[int, int]) -> None:
+        """Record that <event> was handled after <turn> turns."""
+        self.events.append((turn, DIRECTIONS.index(event)))
+
+    def finish(self, board: GameBoard) -> None:
+        """Record the final state of <board>, the board this game was played
+        on, and stop recording its events.
+        """
+        self.turns = board.turns
+        self.final = str(board)
+        board.record = None
+
+    def replay(self, board_type: type = GameBoard) -> GameBoard:
+        """Play the recorded game again on a new board of type <board_type>
+        and return that board.
+        """
+        board = self.new_board(board_type)
+        for turn, direction in self.events:
+            while board.turns < turn:
+                board.give_turns()
+            board.handle_event(DIRECTIONS[direction])
+        while board.turns < self.turns:
+            board.give_turns()
+        return board
+
+    def verify(self, board_type: type = GameBoard) -> bool:
+        """Return whether replaying the recorded game on a new board of type
+        <board_type> ends with the recorded final board.
+
+        Precondition:
+        - This recording has been finished.
+        """
+        return str(self.replay(board_type)) == self.final
+
+    def to_bytes(self) -> bytes:
+        """Return this recording encoded as bytes.
+
+        Each event takes one byte when it happens within 63 turns of the
+        previous one.
+        """
+        grid = self.grid.encode()
+        final = (self.final or '').encode()
+        data = bytearray(RECORD_HEADER.pack(
+            RECORD_MAGIC, self.seed, self.final is not None, self.turns,
+            len(grid), len(final), len(self.events)))
+        data += grid
+        data += final
+        last = 0
+        for turn, direction in self.events:
+            _write_varint(data, (turn - last) << 2 | direction)
+            last = turn
+        return bytes(data)
+
+    @staticmethod
+    def from_bytes(data: bytes) -> GameRecord:
+        """Return the recording encoded in <data> by GameRecord.to_bytes.
+
+        Raise a ValueError if <data> is not an encoded recording, including
+        if it has been cut short or has bytes added to its end.
+        """
+        header = RECORD_HEADER.size
+        if len(data) < header:
+            raise ValueError('data is too short to be a game recording')
+        magic, seed, finished, turns, grid_len, final_len, count = \
+            RECORD_HEADER.unpack_from(data)
+        if magic != RECORD_MAGIC:
+            raise ValueError('data is not a game recording')
+        grid_end = header + grid_len
+        final_end = grid_end + final_len
+        if final_end > len(data):
+            raise ValueError('game recording is cut short')
+        if final_len and not finished:
+            raise ValueError('unfinished game recording has a final board')
+        record = GameRecord(bytes(data[header:grid_end]).decode(), seed)
+        record.turns = turns
+        if finished:
+            record.final = bytes(data[grid_end:final_end]).decode()
+        i = final_end
+        turn = 0
+        for _ in range(count):
+            value, i = _read_varint(data, i)
+            turn += value >> 2
+            if turn > turns:
+                raise ValueError('game recording has an event after its '
+                                 'last turn')
+            record.events.append((turn, value & 3))
+        if i != len(data):
+            raise ValueError('game recording has bytes after its last event')
+        return record
+
+
+def _write_varint(data: bytearray, value: int) -> None:
+    """Append the non-negative integer <value> to <data>, seven bits per byte
+    with the high bit set on every byte but the last.
+    """
+    while value >= 0x80:
+        data.append(value & 0x7F | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def _read_varint(data: bytes, i: int) -> Tuple[int, int]:
+    """Return the integer written by _write_varint at index <i> of <data>,
+    and the index just after it.
+
+    Raise a ValueError if <data> ends before the integer does.
+
+    >>> _read_varint(b'\\x96\\x01', 0)
+    (150, 2)
+    """
+    value = 0
+    shift = 0
+    while True:
+        if i >= len(data):
+            raise ValueError('game recording ends inside an event')
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, i
+        shift += 7
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   '__future__', 'struct',
+                                   'racoon_raiders_src'],
+        'disable': ['E1136'],
+    })
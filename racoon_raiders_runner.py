@@ -0,0 +1,230 @@
+"""Raccoon Raiders: headless batch runner
+
+=== Module Description ===
+This module plays many games of Raccoon Raiders without a display, for
+example to tune levels. Each level is a board string in the format used by
+GameBoard.setup_from_grid, and the Player is driven by a policy: a callable
+that is given the board and the game's own random number generator before
+every turn and returns the direction to move in, or None to stay still.
+
+Games are spread across a pool of processes. Levels are read and submitted
+in chunks, and only a bounded number of chunks are in flight at once, so
+memory use stays flat no matter how many games are played.
+"""
+
+from __future__ import annotations
+
+import os
+import random
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, \
+    Tuple, Type
+
+from racoon_raiders_src import DIRECTIONS, GameBoard
+
+# A policy is given the board and the game's random number generator before
+# each turn and returns the direction the Player should move in, or None if
+# the Player should not move.
+Policy = Callable[[GameBoard, random.Random], Optional[Tuple[int, int]]]
+
+# The number of turns after which a game that has not ended is stopped
+DEFAULT_MAX_TURNS = 1000
+
+
+class GameResult(NamedTuple):
+    """The outcome of one headless game.
+
+    === Attributes ===
+    index:
+        the position of this game's level in the corpus that was played
+    turns:
+        how many turns were played
+    ended:
+        whether the game ended before the turn limit was reached
+    score:
+        the final result of GameBoard.check_game_end (None if not ended)
+    trapped:
+        how many raccoons were trapped at the end of the game
+    """
+    index: int
+    turns: int
+    ended: bool
+    score: Optional[int]
+    trapped: int
+
+
+def random_policy(board: GameBoard,
+                  rng: random.Random) -> Optional[Tuple[int, int]]:
+    """A policy that moves the Player in a direction chosen with <rng> every
+    turn.
+    """
+    return rng.choice(DIRECTIONS)
+
+
+class ScriptedPolicy:
+    """A policy that plays a fixed list of moves, one per turn, and then
+    stays still.
+
+    === Sample Usage ===
+    >>> from racoon_raiders_src import RIGHT
+    >>> policy = ScriptedPolicy([RIGHT, None, RIGHT])
+    >>> policy(GameBoard(3, 1), random.Random(0))
+    (1, 0)
+    """
+    # === Private Attributes ===
+    # _moves:
+    #   the move to make on each turn, indexed by the board's turn count
+    _moves: List[Optional[Tuple[int, int]]]
+
+    def __init__(self, moves: Iterable[Optional[Tuple[int, int]]]) -> None:
+        """Initialize this policy to play <moves> in order."""
+        self._moves = list(moves)
+
+    def __call__(self, board: GameBoard,
+                 rng: random.Random) -> Optional[Tuple[int, int]]:
+        """Return the move for the turn that <board> is about to play. <rng>
+        is not used.
+        """
+        if board.turns < len(self._moves):
+            return self._moves[board.turns]
+        return None
+
+
+def play_game(grid: str, policy: Policy, seed: int, index: int = 0,
+              max_turns: int = DEFAULT_MAX_TURNS,
+              board_type: Type[GameBoard] = GameBoard) -> GameResult:
+    """Play the level <grid> with the Player driven by <policy> until the
+    game ends or <max_turns> turns have been played, and return the result.
+
+    The board's random number generator and a new one that is given to
+    <policy> are both seeded with <seed>, so the same arguments always give
+    the same result. The module-level random number generator is not used.
+
+    Precondition:
+    - <grid> contains a Player
+
+    >>> play_game('P-B\\n-BR', random_policy, 0).ended
+    True
+    """
+    rng = random.Random(seed)
+    board = board_type(1, 1, seed)
+    board.setup_from_grid(grid)
+    while not board.ended and board.turns < max_turns:
+        move = policy(board, rng)
+        if move is not None:
+            board.handle_event(move)
+        board.give_turns()
+    return GameResult(index, board.turns, board.ended, board.check_game_end(),
+                      board.trapped_raccoons())
+
+
+# The policy, turn limit and board type of the games played by this worker
+# process, set once by _start_worker so they are not sent with every chunk.
+_worker_settings = None
+
+
+def _start_worker(policy: Policy, max_turns: int,
+                  board_type: Type[GameBoard]) -> None:
+    """Record the settings of the games this worker process will play."""
+    global _worker_settings
+    _worker_settings = (policy, max_turns, board_type)
+
+
+def _play_chunk(tasks: List[Tuple[int, str, int]]) -> List[GameResult]:
+    """Play the games in <tasks>, given as (index, grid, seed) tuples, with
+    this worker's settings and return their results.
+    """
+    policy, max_turns, board_type = _worker_settings
+    return [play_game(grid, policy, seed, index, max_turns, board_type)
+            for index, grid, seed in tasks]
+
+
+def _chunks(levels: Iterable[str], seed: int,
+            chunk_size: int) -> Iterator[List[Tuple[int, str, int]]]:
+    """Yield the tasks for <levels> in lists of at most <chunk_size>.
+
+    Game i is seeded with <seed> + i.
+    """
+    tasks = ((i, grid, seed + i) for i, grid in enumerate(levels))
+    chunk = list(islice(tasks, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(tasks, chunk_size))
+
+
+def run_games(levels: Iterable[str], policy: Policy = random_policy,
+              seed: int = 0, max_turns: int = DEFAULT_MAX_TURNS,
+              processes: Optional[int] = None, chunk_size: int = 64,
+              board_type: Type[GameBoard] = GameBoard) -> Iterator[GameResult]:
+    """Play every level in <levels> and yield the results in the same order.
+
+    Game i is played by play_game with seed <seed> + i, so the results do not
+    depend on how many processes are used. <levels> is read lazily, and at
+    most two chunks of <chunk_size> games per process are in flight at once.
+
+    If <processes> is 0 the games are played in this process. Otherwise they
+    are played in a pool of <processes> worker processes (by default, one per
+    CPU). <policy> must be picklable to be sent to the workers, for example a
+    module-level function or a ScriptedPolicy.
+
+    >>> levels = ['P-B\\n-BR', 'PR-\\n---']
+    >>> [r.index for r in run_games(levels, processes=0)]
+    [0, 1]
+    """
+    chunks = _chunks(levels, seed, chunk_size)
+    if processes == 0:
+        _start_worker(policy, max_turns, board_type)
+        for chunk in chunks:
+            yield from _play_chunk(chunk)
+        return
+
+    if processes is None:
+        processes = os.cpu_count() or 1
+    with Pool(processes, _start_worker,
+              (policy, max_turns, board_type)) as pool:
+        window = 2 * processes
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.apply_async(_play_chunk, (chunk,)))
+            if len(pending) >= window:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def read_levels(lines: Iterable[str]) -> Iterator[str]:
+    """Yield the levels in <lines>, where levels are separated by blank lines.
+
+    This reads a corpus file one level at a time, so it can be passed to
+    run_games without loading the whole file.
+
+    >>> list(read_levels(['P-\\n', 'R-\\n', '\\n', 'PR\\n']))
+    ['P-\\nR-', 'PR']
+    """
+    rows = []
+    for line in lines:
+        line = line.rstrip('\n')
+        if line:
+            rows.append(line)
+        elif rows:
+            yield '\n'.join(rows)
+            rows = []
+    if rows:
+        yield '\n'.join(rows)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   'random', '__future__', 'collections',
+                                   'itertools', 'multiprocessing', 'os',
+                                   'racoon_raiders_src'],
+        'disable': ['E1136'],
+    })
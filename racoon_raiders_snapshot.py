@@ -0,0 +1,296 @@
+"""Raccoon Raiders: board snapshots
+
+=== Module Description ===
+This module holds the binary format of the snapshots that
+GameBoard.to_snapshot makes. A snapshot is a header, the state of the board's
+random number generator, one tile code per tile (row by row), and then the
+position and kind of every Raccoon in turn order.
+
+A sparse snapshot, which a SparseGameBoard makes, has a table of the index
+and code of every tile that is not empty instead of a code for every tile,
+so its size depends only on how many characters are on the board. Its
+header gives SPARSE_SNAPSHOT_VERSION as its version.
+
+The functions here pack and unpack snapshots, check that they are well
+formed, and save and load them as files. GameBoard.to_snapshot makes a
+snapshot of a board, and GameBoard.load_snapshot fills a board from one.
+"""
+
+from __future__ import annotations
+
+import mmap
+import re
+import struct
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, \
+    NamedTuple, Optional, Tuple
+
+from racoon_raiders_grid import IN_CAN_CODE, PLAYER_CODE, RACCOON_CODE, \
+    RACCOON_CODES, SMART_RACCOON_CODE, occupied
+
+if TYPE_CHECKING:
+    from racoon_raiders_src import GameBoard
+
+# The header is: the magic bytes, the format version, the board's width,
+# height, turns and seed, whether the game has ended, the index in DIRECTIONS
+# of the Player's unprocessed event (or NO_EVENT), the random number
+# generator's version, its gauss value and whether it has one, and the number
+# of Raccoons. It is followed by the generator's 625 state words.
+SNAPSHOT_MAGIC = b'RRS\0'
+SNAPSHOT_VERSION = 1
+SPARSE_SNAPSHOT_VERSION = 2
+SNAPSHOT_HEADER = struct.Struct('<4sHIIQQ?BId?I')
+SNAPSHOT_RNG = struct.Struct('<625I')
+# Each Raccoon is stored as its x and y coordinates and its kind ('R' or 'S')
+SNAPSHOT_RACCOON = struct.Struct('<IIB')
+# Each tile in the table of a sparse snapshot is stored as its index and code
+SNAPSHOT_TILE = struct.Struct('<QB')
+# The event stored when the Player has no unprocessed event; the others are
+# the indexes of the four directions in DIRECTIONS
+NO_EVENT = 255
+EVENTS = 4
+
+# Match every byte that is not a tile code, and the tiles with Raccoons
+_UNKNOWN_TILE = re.compile(b'[^RSPOCB@-]')
+_RACCOON_TILE = re.compile(b'[RS@]')
+# The codes that the tiles in the table of a sparse snapshot may have
+_TABLE_CODES = frozenset(b'RSPOCB@')
+
+
+class Snapshot(NamedTuple):
+    """The state of a game, as stored in a snapshot.
+
+    === Public Attributes ===
+    width:
+        the number of squares wide the board is
+    height:
+        the number of squares high the board is
+    turns:
+        how many turns have passed in the game
+    seed:
+        the seed that the board's random number generator was created with
+    ended:
+        whether the game has ended
+    event:
+        the index in DIRECTIONS of the Player's unprocessed event, or
+        NO_EVENT if there is none
+    rng_state:
+        the state of the board's random number generator, as given by
+        random.Random.getstate
+    tiles:
+        the code of every tile, row by row, as a bytes-like object, or the
+        table of a sparse snapshot, made by pack_tile_table. In an unpacked
+        snapshot this is a memoryview of the snapshot's data.
+    raccoons:
+        the x and y coordinates and the kind (the ord of 'R' or 'S') of every
+        Raccoon, in turn order
+    sparse:
+        whether this is a sparse snapshot
+    """
+    width: int
+    height: int
+    turns: int
+    seed: int
+    ended: bool
+    event: int
+    rng_state: Tuple[int, Tuple[int, ...], Optional[float]]
+    tiles: memoryview
+    raccoons: List[Tuple[int, int, int]]
+    sparse: bool = False
+
+
+def pack_tile_table(tiles: Iterable[Tuple[int, int]]) -> bytes:
+    """Return the table of a sparse snapshot with the tiles <tiles>, the
+    index and code of every tile that is not empty, in order of index.
+
+    >>> len(pack_tile_table([(0, ord('P')), (7, ord('B'))]))
+    18
+    """
+    return b''.join(SNAPSHOT_TILE.pack(i, code) for i, code in tiles)
+
+
+def pack_snapshot(snapshot: Snapshot) -> bytes:
+    """Return the bytes of <snapshot>.
+
+    Precondition:
+    - len(snapshot.tiles) == snapshot.width * snapshot.height, unless
+      snapshot.sparse
+    - 0 <= snapshot.seed < 2 ** 64
+
+    >>> state = (3, tuple(range(625)), None)
+    >>> data = pack_snapshot(Snapshot(3, 1, 7, 1, False, NO_EVENT, state,
+    ...                               b'R-O', [(0, 0, ord('R'))]))
+    >>> with memoryview(data) as view:
+    ...     snapshot = read_snapshot(view)
+    ...     list(snapshot_tiles(snapshot))
+    [(0, 82), (2, 79)]
+    >>> snapshot.turns, snapshot.raccoons, snapshot.rng_state == state
+    (7, [(0, 0, 82)], True)
+    >>> table = pack_tile_table([(0, ord('R')), (2, ord('O'))])
+    >>> data = pack_snapshot(Snapshot(3, 1, 7, 1, False, NO_EVENT, state,
+    ...                               table, [(0, 0, ord('R'))], True))
+    >>> with memoryview(data) as view:
+    ...     snapshot = read_snapshot(view)
+    ...     list(snapshot_tiles(snapshot))
+    [(0, 82), (2, 79)]
+    """
+    rng_version, words, gauss = snapshot.rng_state
+    version = SPARSE_SNAPSHOT_VERSION if snapshot.sparse else SNAPSHOT_VERSION
+    data = bytearray(SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, version, snapshot.width, snapshot.height,
+        snapshot.turns, snapshot.seed, snapshot.ended, snapshot.event,
+        rng_version, gauss or 0.0, gauss is not None,
+        len(snapshot.raccoons)))
+    data += SNAPSHOT_RNG.pack(*words)
+    data += snapshot.tiles
+    for raccoon in snapshot.raccoons:
+        data += SNAPSHOT_RACCOON.pack(*raccoon)
+    return bytes(data)
+
+
+def read_snapshot(view: memoryview) -> Snapshot:
+    """Return the snapshot in <view>, without copying its tile codes.
+
+    The tiles of the snapshot returned are a view of part of <view>, which
+    the caller must release once the tiles have been read.
+
+    Raise a ValueError if <view> is not a well formed snapshot: if it is cut
+    short or has an unknown tile code, if the table of a sparse snapshot is
+    out of order or gives a tile off the board, if its raccoons do not match
+    the tiles with Raccoons on them, or if it has an unknown event or an
+    event but no Player. The state of its random number generator is not
+    checked.
+
+    >>> with memoryview(b'RRS\\0') as view:
+    ...     read_snapshot(view)
+    Traceback (most recent call last):
+    ValueError: data is too short to be a board snapshot
+    """
+    if len(view) < SNAPSHOT_HEADER.size + SNAPSHOT_RNG.size:
+        raise ValueError('data is too short to be a board snapshot')
+    magic, version, width, height, turns, seed, ended, event, \
+        rng_version, gauss, has_gauss, count = \
+        SNAPSHOT_HEADER.unpack_from(view)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError('data is not a board snapshot')
+    if version not in (SNAPSHOT_VERSION, SPARSE_SNAPSHOT_VERSION):
+        raise ValueError(f'unsupported snapshot version {version}')
+    sparse = version == SPARSE_SNAPSHOT_VERSION
+    words = SNAPSHOT_RNG.unpack_from(view, SNAPSHOT_HEADER.size)
+    start = SNAPSHOT_HEADER.size + SNAPSHOT_RNG.size
+    end = len(view) - count * SNAPSHOT_RACCOON.size
+    if sparse:
+        cut = end < start or (end - start) % SNAPSHOT_TILE.size != 0
+    else:
+        cut = end != start + width * height
+    if width == 0 or height == 0 or cut:
+        raise ValueError('snapshot has the wrong length')
+
+    with view[end:] as table:
+        raccoons = list(SNAPSHOT_RACCOON.iter_unpack(table))
+    tiles = view[start:end]
+    try:
+        if sparse:
+            has_player, raccoon_codes = _check_table(tiles, width * height)
+        else:
+            if _UNKNOWN_TILE.search(tiles):
+                raise ValueError('snapshot has an unknown tile code')
+            has_player = re.search(b'P', tiles) is not None
+            raccoon_codes = {match.start(): tiles[match.start()]
+                             for match in _RACCOON_TILE.finditer(tiles)}
+        _check_raccoons(raccoons, width, height, raccoon_codes)
+        if event != NO_EVENT and event >= EVENTS:
+            raise ValueError(f'snapshot has an unknown event {event}')
+        if event != NO_EVENT and not has_player:
+            raise ValueError('snapshot has an event but no player')
+    except ValueError:
+        tiles.release()
+        raise
+    return Snapshot(width, height, turns, seed, ended, event,
+                    (rng_version, words, gauss if has_gauss else None),
+                    tiles, raccoons, sparse)
+
+
+def _check_table(table: memoryview, size: int) -> Tuple[bool, Dict[int, int]]:
+    """Raise a ValueError unless <table>, the table of a sparse snapshot of
+    a board of <size> tiles, gives tiles on the board in order of index, each
+    with a known code other than that of an empty tile.
+
+    Return whether the table has a Player, and the code of every tile in it
+    with a Raccoon on it, keyed by index.
+    """
+    has_player = False
+    raccoon_codes = {}
+    last = -1
+    for i, code in SNAPSHOT_TILE.iter_unpack(table):
+        if code not in _TABLE_CODES:
+            raise ValueError('snapshot has an unknown tile code')
+        if i >= size:
+            raise ValueError(f'snapshot has a tile off the board at {i}')
+        if i <= last:
+            raise ValueError(f'snapshot has a tile out of order at {i}')
+        last = i
+        has_player = has_player or code == PLAYER_CODE
+        if code in RACCOON_CODES:
+            raccoon_codes[i] = code
+    return has_player, raccoon_codes
+
+
+def _check_raccoons(raccoons: List[Tuple[int, int, int]], width: int,
+                    height: int, raccoon_codes: Dict[int, int]) -> None:
+    """Raise a ValueError unless <raccoons>, the raccoon table of a snapshot
+    of a <width> by <height> board whose tiles with Raccoons on them have the
+    codes <raccoon_codes> (keyed by index), gives every such tile exactly
+    once, with the right kind.
+    """
+    for x, y, kind in raccoons:
+        code = raccoon_codes.get(y * width + x) \
+            if x < width and y < height else None
+        if kind not in (RACCOON_CODE, SMART_RACCOON_CODE) or \
+                (code != kind and code != IN_CAN_CODE):
+            raise ValueError(f'snapshot has the wrong raccoon at ({x}, {y})')
+    if len({(x, y) for x, y, _ in raccoons}) != len(raccoons) or \
+            len(raccoon_codes) != len(raccoons):
+        raise ValueError('snapshot raccoons do not match its tiles')
+
+
+def snapshot_tiles(snapshot: Snapshot) -> Iterator[Tuple[int, int]]:
+    """Return the index and code of every tile of <snapshot> that is not
+    empty, in order of index.
+    """
+    if snapshot.sparse:
+        return SNAPSHOT_TILE.iter_unpack(snapshot.tiles)
+    return occupied(snapshot.tiles)
+
+
+def save_snapshot(board: GameBoard, path: str) -> None:
+    """Write a snapshot of the game on <board>, made by
+    GameBoard.to_snapshot, to the file at <path>.
+    """
+    with open(path, 'wb') as f:
+        f.write(board.to_snapshot())
+
+
+def load_snapshot_file(board: GameBoard, path: str) -> None:
+    """Set the state of <board> to the snapshot in the file at <path>, which
+    is memory-mapped rather than read into memory.
+
+    Raise a ValueError if the file is not a valid snapshot.
+    """
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            board.load_snapshot(data)
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': ['save_snapshot', 'load_snapshot_file'],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   '__future__', 'mmap', 're', 'struct',
+                                   'racoon_raiders_grid',
+                                   'racoon_raiders_src'],
+        'disable': ['E1136'],
+    })
@@ -0,0 +1,280 @@
+"""Raccoon Raiders: offline solver
+
+=== Module Description ===
+This module searches for the best way to play a level of Raccoon Raiders: a
+sequence of Player moves that ends the game (every raccoon trapped or in a
+GarbageCan) with the highest score, and among those, in the fewest turns.
+
+Raccoons only move every RACCOON_TURN_FREQUENCY turns, and how they move
+depends on the board's random number generator. Once that generator is
+seeded, a game is fully determined by the Player's moves, so the level is
+searched separately for each of a number of sampled seeds, one seed per
+worker process. Every plan found is then played against all of the sampled
+seeds, and the plan with the best expected score (the mean over the seeds)
+or the best guaranteed score (the minimum, treating the raccoons as an
+adversary) is returned.
+
+Each search is a breadth-first search over the Player's moves (including not
+moving), one turn per level of the search. Boards are branched with
+GameBoard.clone, states that have already been reached are skipped using a
+transposition table, and only the most promising boards of each level are
+kept, so large levels can be searched in bounded time and memory.
+"""
+
+from __future__ import annotations
+
+import os
+from multiprocessing import Pool
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from racoon_raiders_compact import CompactGameBoard
+from racoon_raiders_src import DIRECTIONS, RACCOON_TURN_FREQUENCY, GameBoard
+from racoon_raiders_runner import ScriptedPolicy, play_game
+
+# The moves the Player can make on a turn; None means not moving
+MOVES = DIRECTIONS + [None]
+
+# The to_grid letters of the characters that a raccoon cannot move onto
+BLOCKING = 'PRSB@'
+
+# The ways of combining the scores of a plan over the sampled seeds
+EXPECTATION = 'expectation'
+ADVERSARY = 'adversary'
+
+# How many turns are searched before giving up on a level
+DEFAULT_MAX_TURNS = 200
+# How many boards are kept at each turn of a search
+DEFAULT_BEAM_WIDTH = 1000
+
+Move = Optional[Tuple[int, int]]
+
+
+class Solution(NamedTuple):
+    """The best plan the solver found for a level.
+
+    === Attributes ===
+    moves:
+        the Player's move on each turn, where None means not moving
+    score:
+        the mean (for EXPECTATION) or minimum (for ADVERSARY) final score of
+        the plan over the sampled seeds, where a game that the plan does not
+        end scores 0
+    ended:
+        the fraction of the sampled seeds for which the plan ends the game
+    """
+    moves: List[Move]
+    score: float
+    ended: float
+
+
+def _state_key(board: GameBoard, rng_id: int) -> Tuple[int, int, int]:
+    """Return a key for <board> (between turns), whose random number
+    generator's state has the id <rng_id> in the search.
+
+    Boards are told apart by their state_hash, which does not need the whole
+    board to be read, so two boards with different tiles could only get the
+    same key if their 64-bit state_hash values collided. Raccoons inside a
+    GarbageCan never move again, so a SmartRaccoon inside a can does not need
+    to be told apart from a Raccoon.
+
+    The state_hash does not cover the order in which the raccoons take their
+    turns, so two boards with the same tiles whose raccoons have swapped
+    places get the same key, although they may play out differently. The
+    search then keeps only the first of them, which can make it miss a plan,
+    but every plan it returns is one that was played out.
+    """
+    return board.state_hash, board.turns % RACCOON_TURN_FREQUENCY, rng_id
+
+
+def _promise(board: GameBoard) -> int:
+    """Return how promising <board> is, for choosing which boards to keep.
+
+    Boards with more raccoons trapped are better, then boards where the free
+    raccoons are more closed in, the Player is closer to them, and the
+    clusters of RecyclingBins are bigger.
+
+    The free raccoons and the Player are found with positions_of, and only
+    the tiles around the free raccoons are read, rather than the whole
+    board, as this is called for every board of a turn whose boards do not
+    all fit in the beam.
+    """
+    free = board.positions_of('R') + board.positions_of('S')
+
+    closed = 0
+    for x, y in free:
+        for dx, dy in DIRECTIONS:
+            nx, ny = x + dx, y + dy
+            if not board.on_board(nx, ny) or \
+                    board.char_at(nx, ny) in BLOCKING:
+                closed += 1
+    distance = 0
+    players = board.positions_of('P')
+    if free and players:
+        px, py = players[0]
+        distance = min(abs(x - px) + abs(y - py) for x, y in free)
+    return 100 * board.trapped_raccoons() + 10 * closed - distance + \
+        board.adjacent_bin_score()
+
+
+def search(grid: str, seed: int, max_turns: int = DEFAULT_MAX_TURNS,
+           beam_width: int = DEFAULT_BEAM_WIDTH,
+           extra_turns: int = 0) -> Optional[List[Move]]:
+    """Return the moves that end the game on level <grid>, when its board is
+    seeded with <seed>, with the highest score in the fewest turns, or None
+    if no way to end it within <max_turns> turns was found.
+
+    The search stops <extra_turns> turns after the first turn on which the
+    game can be ended, or as soon as a plan gets the highest possible score.
+    A longer plan is only chosen if it scores higher. At most <beam_width>
+    boards are kept at each turn, so the plan returned may not be the best
+    if the beam is too narrow.
+
+    Precondition:
+    - <grid> contains a Player and at least one raccoon
+
+    >>> from racoon_raiders_src import RIGHT
+    >>> search('PB-R', 0) == [RIGHT]
+    True
+    >>> search('P--R', 0, max_turns=1) is None
+    True
+    """
+    board = CompactGameBoard(1, 1, seed)
+    board.setup_from_grid(grid)
+    raccoons = sum(grid.count(c) for c in 'RS@')
+    best_score = 10 * raccoons + grid.count('B')
+
+    best = None
+    stop = max_turns
+    # The random number generator is only used on the raccoons' turns, so
+    # its state is only read then, and is kept as a small id in between
+    rng_ids = {board.rng.getstate(): 0}
+    seen = {_state_key(board, 0)}
+    boards = [(board, [], 0)]
+    for turn in range(1, max_turns + 1):
+        if turn > stop or not boards:
+            break
+        next_boards = []
+        for board, moves, rng_id in boards:
+            for move in MOVES:
+                child = board.clone()
+                if move is not None:
+                    child.handle_event(move)
+                child.give_turns()
+                child_rng_id = rng_id
+                if child.turns % RACCOON_TURN_FREQUENCY == 0:
+                    child_rng_id = rng_ids.setdefault(child.rng.getstate(),
+                                                      len(rng_ids))
+                key = _state_key(child, child_rng_id)
+                if key in seen:
+                    continue
+                seen.add(key)
+                if not child.ended:
+                    next_boards.append((child, moves + [move],
+                                        child_rng_id))
+                elif best is None or child.check_game_end() > best[0]:
+                    best = (child.check_game_end(), moves + [move])
+                    stop = min(stop, turn + extra_turns)
+        if best is not None and best[0] >= best_score:
+            break
+        if len(next_boards) > beam_width:
+            next_boards.sort(key=lambda item: _promise(item[0]), reverse=True)
+            del next_boards[beam_width:]
+        boards = next_boards
+
+    if best is None:
+        return None
+    return best[1]
+
+
+def evaluate(grid: str, moves: List[Move],
+             seeds: Iterable[int]) -> List[Optional[int]]:
+    """Return the final score of playing <moves> on level <grid> with each of
+    <seeds>, or None for the seeds with which the game does not end.
+
+    >>> from racoon_raiders_src import RIGHT
+    >>> evaluate('PB-R', [RIGHT], [0, 1])
+    [11, 11]
+    """
+    return [play_game(grid, ScriptedPolicy(moves), seed,
+                      max_turns=len(moves)).score
+            for seed in seeds]
+
+
+def _combine(scores: List[Optional[int]], mode: str) -> float:
+    """Return the score of a plan whose final scores over the sampled seeds
+    are <scores>, according to <mode>.
+    """
+    values = [0 if score is None else score for score in scores]
+    if mode == EXPECTATION:
+        return sum(values) / len(values)
+    return min(values)
+
+
+def solve(grid: str, seeds: Iterable[int] = range(8), mode: str = EXPECTATION,
+          max_turns: int = DEFAULT_MAX_TURNS,
+          beam_width: int = DEFAULT_BEAM_WIDTH, extra_turns: int = 0,
+          processes: Optional[int] = None) -> Optional[Solution]:
+    """Return the best plan for level <grid> over the sampled <seeds> of the
+    board's random number generator, or None if no plan was found for any
+    of them.
+
+    The level is searched (see search) once for each seed, and every plan
+    found is then scored against all of the seeds according to <mode>, which
+    is EXPECTATION or ADVERSARY. Ties go to the shorter plan.
+
+    If <processes> is 0 the searches run in this process. Otherwise they run
+    in a pool of <processes> worker processes (by default, one per CPU).
+
+    Raise a ValueError if <mode> is not EXPECTATION or ADVERSARY, or if
+    <seeds> is empty.
+
+    Precondition:
+    - <grid> contains a Player and at least one raccoon
+
+    >>> from racoon_raiders_src import RIGHT
+    >>> solve('PB-R', processes=0)
+    Solution(moves=[(1, 0)], score=11.0, ended=1.0)
+    """
+    if mode not in (EXPECTATION, ADVERSARY):
+        raise ValueError(f'unknown mode: {mode!r}')
+    seeds = list(seeds)
+    if not seeds:
+        raise ValueError('at least one seed is needed')
+
+    searches = [(grid, seed, max_turns, beam_width, extra_turns)
+                for seed in seeds]
+    if processes == 0:
+        plans = [search(*args) for args in searches]
+    else:
+        with Pool(processes or os.cpu_count() or 1) as pool:
+            plans = pool.starmap(search, searches)
+
+    best = None
+    tried = set()
+    for moves in plans:
+        if moves is None or tuple(moves) in tried:
+            continue
+        tried.add(tuple(moves))
+        scores = evaluate(grid, moves, seeds)
+        solution = Solution(moves, _combine(scores, mode),
+                            sum(s is not None for s in scores) / len(seeds))
+        if best is None or (solution.score, -len(moves)) > \
+                (best.score, -len(best.moves)):
+            best = solution
+    return best
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   '__future__', 'multiprocessing', 'os',
+                                   'racoon_raiders_compact',
+                                   'racoon_raiders_src',
+                                   'racoon_raiders_runner'],
+        'disable': ['E1136'],
+    })
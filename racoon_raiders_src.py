@@ -18,10 +18,21 @@ and Sophia Huynh.
 This module contains all of the classes necessary for a1_game.py to run.
 """
 
+
 from __future__ import annotations
 
-from random import shuffle
-from typing import List, Tuple, Optional
+import random
+import sys
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+
+from racoon_raiders_grid import BIN_CODE, CAN_CODES, CLOSED_CAN_CODE, \
+    EMPTY_CODE, IN_CAN_CODE, OCCUPIED, PLAYER_CODE, RACCOON_CODE, \
+    RACCOON_CODES, SMART_RACCOON_CODE, TileGrid, occupied, read_level
+from racoon_raiders_snapshot import NO_EVENT, Snapshot, pack_snapshot, \
+    read_snapshot, snapshot_tiles
+
+if TYPE_CHECKING:
+    from racoon_raiders_record import GameRecord
 
 # Each raccoon moves every this many turns
 RACCOON_TURN_FREQUENCY = 20
@@ -33,23 +44,46 @@ LEFT = (-1, 0)
 RIGHT = (1, 0)
 DIRECTIONS = [LEFT, UP, RIGHT, DOWN]
 
+# Seeds are kept to 64 bits, so that they fit in snapshots and recordings
+SEED_MASK = (1 << 64) - 1
 
-def get_shuffled_directions() -> List[Tuple[int, int]]:
+
+def get_shuffled_directions(rng: Optional[random.Random] = None) \
+        -> List[Tuple[int, int]]:
     """
     Provided helper that returns a shuffled copy of DIRECTIONS.
     You should use this where appropriate
+
+    The copy is shuffled with <rng>, or with the module-level random number
+    generator if <rng> is None.
     """
     to_return = DIRECTIONS[:]
-    shuffle(to_return)
+    if rng is None:
+        random.shuffle(to_return)
+    else:
+        rng.shuffle(to_return)
     return to_return
 
 
-class GameBoard:
+class GameBoard(TileGrid):
     """A game board on which the game is played.
 
+    The tile codes of the board and the indexes kept over them are the
+    TileGrid that this board is; see racoon_raiders_grid.
+
     === Public Attributes ===
+    debug:
+        whether check_game_end should cross-check the board's trapped and
+        inside-can counts and its state_hash against a full scan
     ended:
         whether this game has ended or not
+    record:
+        the recording that events handled by this board are added to, or None
+        if this game is not being recorded
+    rng:
+        the random number generator that the raccoons on this board use
+    seed:
+        the seed that rng was created with, from 0 to 2 ** 64 - 1
     turns:
         how many turns have passed in the game
     width:
@@ -71,26 +105,30 @@ class GameBoard:
     # _player:
     #   the player of the game
     # _board:
-    #   the rows on the board in the game
-    # _raccoons:
-    #   list containing every raccoon in the game
-    # _recycling:
-    #   list containing every recycling bin in the game
+    #   the rows on the board in the game, or None for a row that has not
+    #   been made yet. A row's characters are made from its tile codes the
+    #   first time one of its tiles is used (see _unpack), so loading a level
+    #   or cloning a board makes no characters but the Player.
 
+    debug: bool
     ended: bool
+    record: Optional[GameRecord]
+    rng: random.Random
+    seed: int
     turns: int
-    width: int
-    height: int
     _player: Optional[Player]
-    _board: List[List[List[Character]]]
-    _raccoons: List[Raccoon]
-    _recycling: List[RecyclingBin]
+    _board: List[Optional[List[List[Character]]]]
 
-    def __init__(self, w: int, h: int) -> None:
+    def __init__(self, w: int, h: int, seed: Optional[int] = None) -> None:
         """Initialize this Board to be of the given width <w> and height <h> in
         squares. A board is initially empty (no characters) and no turns have
         been taken.
 
+        The board's random number generator is seeded with <seed>, reduced
+        to its lowest 64 bits (as an unsigned number). If <seed> is None, a
+        seed is drawn from the module-level random number generator, so
+        seeding that first still makes a game repeatable.
+
         >>> b = GameBoard(3, 3)
         >>> b.width == 3
         True
@@ -101,28 +139,19 @@ class GameBoard:
         >>> b.ended
         False
         """
-
+        TileGrid.__init__(self, w, h)
         self.ended = False
         self.turns = 0
 
-        self.width = w
-        self.height = h
+        if seed is None:
+            seed = random.getrandbits(64)
+        self.seed = seed & SEED_MASK
+        self.rng = random.Random(self.seed)
+        self.record = None
+        self.debug = False
 
         self._player = None
-
-        self._board = []
-        i = 0
-        while i < self.height:
-            row = []
-            j = 0
-            while j < self.width:
-                row.append([])
-                j += 1
-            self._board.append(row)
-            i += 1
-
-        self._raccoons = []
-        self._recycling = []
+        self._board = self._new_tiles()
 
     def move(self, x: int, y: int, nx: int, ny: int) -> None:
         """Move a character from their current spot in x and y to a
@@ -136,8 +165,46 @@ class GameBoard:
         >>> b.at(1, 1) == []
         True
         """
-        change = self._board[y][x].pop()
-        self._board[ny][nx].append(change)
+        change = self._take(x, y)
+        if isinstance(change, Raccoon):
+            self._roster.moved(y * self.width + x, ny * self.width + nx)
+        self._put(nx, ny, change)
+        self._refresh_tile(x, y)
+        self._refresh_tile(nx, ny)
+
+    def shift_bins(self, x: int, y: int, direction: Tuple[int, int],
+                   n: int) -> None:
+        """Move the <n> RecyclingBins in a line from tile (x, y) in
+        <direction> one tile further in that direction, and update their
+        coordinates.
+
+        The bins are shifted all at once: only the tiles at the two ends of
+        the line change, so only those are updated.
+
+        Preconditions:
+        - direction in DIRECTIONS
+        - each of the <n> tiles in the line holds only a RecyclingBin
+        - the tile after the line is on the board and empty
+
+        >>> b = GameBoard(4, 1)
+        >>> bins = [RecyclingBin(b, 0, 0), RecyclingBin(b, 1, 0)]
+        >>> b.shift_bins(0, 0, RIGHT, 2)
+        >>> print(b)
+        -BB-
+        >>> [(rb.x, rb.y) for rb in bins]
+        [(1, 0), (2, 0)]
+        """
+        dx, dy = direction
+        bins = [self.at(x + k * dx, y + k * dy)[0] for k in range(n)]
+        self._put(x + n * dx, y + n * dy, bins[-1])
+        for k in range(n - 1, 0, -1):
+            self._replace(x + k * dx, y + k * dy, bins[k - 1])
+        self._take(x, y)
+        for rb in bins:
+            rb.x += dx
+            rb.y += dy
+        self._refresh_tile(x, y)
+        self._refresh_tile(x + n * dx, y + n * dy)
 
     def place_character(self, c: Character) -> None:
         """Record that character <c> is on this board.
@@ -162,13 +229,124 @@ class GameBoard:
         >>> b.at(1, 1)[0] == r  # requires GameBoard.at be implemented to work
         True
         """
+        if isinstance(c, Raccoon):
+            self._roster.add(c.y * self.width + c.x, type(c))
+            if self.at(c.x, c.y):
+                # the Raccoon is being placed inside an open GarbageCan
+                c.inside_can = True
+        self._put(c.x, c.y, c)
         if isinstance(c, Player):
+            # only set once the Player is on its tile; see _unpack
             self._player = c
-        elif isinstance(c, Raccoon):
-            self._raccoons.append(c)
-        elif isinstance(c, RecyclingBin):
-            self._recycling.append(c)
-        self._board[c.y][c.x].append(c)
+        self._refresh_tile(c.x, c.y)
+
+    def _new_tiles(self) -> List[Optional[List[List[Character]]]]:
+        """Return the rows of tiles for a new board, none of them made yet."""
+        return [None] * self.height
+
+    def _row(self, y: int) -> List[List[Character]]:
+        """Return row <y> of the tiles, making its characters from its tile
+        codes if it has not been made yet.
+        """
+        row = self._board[y]
+        if row is None:
+            start = y * self.width
+            row = [[] for _ in range(self.width)]
+            for match in OCCUPIED.finditer(self._grid, start,
+                                           start + self.width):
+                row[match.start() - start] = self._unpack(match.start())
+            self._board[y] = row
+        return row
+
+    def _unpack(self, i: int) -> List[Character]:
+        """Return new characters for the unused tile at index <i> of _grid,
+        made from its tile code and, for a Raccoon, the class in the roster.
+
+        The Player is made as soon as it is loaded, so a Player's tile gives
+        the Player if it is there, and no characters otherwise.
+        """
+        x, y = i % self.width, i // self.width
+        code = self._grid[i]
+        if code == PLAYER_CODE:
+            player = self._player
+            return [player] if player is not None and \
+                (player.x, player.y) == (x, y) else []
+        chars = []
+        if code in CAN_CODES or code == IN_CAN_CODE:
+            can = _unplaced(GarbageCan, self, x, y)
+            can.locked = code == CLOSED_CAN_CODE
+            chars.append(can)
+        elif code == BIN_CODE:
+            chars.append(_unplaced(RecyclingBin, self, x, y))
+        if code in RACCOON_CODES:
+            raccoon = _unplaced(self._roster.kind(i), self, x, y)
+            raccoon.inside_can = code == IN_CAN_CODE
+            chars.append(raccoon)
+        return chars
+
+    def _put(self, x: int, y: int, c: Character) -> None:
+        """Add character <c> on top of the characters at tile (x, y)."""
+        self._row(y)[x].append(c)
+
+    def _take(self, x: int, y: int) -> Character:
+        """Remove and return the top character at tile (x, y)."""
+        return self._row(y)[x].pop()
+
+    def _replace(self, x: int, y: int, c: Character) -> None:
+        """Replace the only character at tile (x, y) with <c>."""
+        self._row(y)[x][0] = c
+
+    def _stored(self, x: int, y: int) -> List[Character]:
+        """Return the characters stored for tile (x, y), which is on this
+        board and has been used by _put or _take.
+        """
+        return self._board[y][x]
+
+    def _tiles_memory(self) -> int:
+        """Return roughly how many bytes the tiles and their characters use."""
+        size = sys.getsizeof(self._board)
+        for row in self._board:
+            if row is not None:
+                size += sys.getsizeof(row)
+                for tile in row:
+                    size += sys.getsizeof(tile) + \
+                        sum(map(sys.getsizeof, tile))
+        return size
+
+    def set_locked(self, x: int, y: int, locked: bool) -> None:
+        """Lock or unlock the GarbageCan at tile (x, y), according to <locked>.
+
+        Players and Raccoons should lock and unlock garbage cans through this
+        method, so that the board's record of the tile stays up to date.
+
+        Precondition:
+        - There is a GarbageCan at tile (x, y).
+
+        >>> b = GameBoard(2, 1)
+        >>> g = GarbageCan(b, 1, 0, False)
+        >>> b.set_locked(1, 0, True)
+        >>> g.locked
+        True
+        >>> b.char_at(1, 0)
+        'C'
+        """
+        # a GarbageCan is always the first character on its tile
+        # noinspection PyUnresolvedReferences
+        self.at(x, y)[0].locked = locked
+        self._refresh_tile(x, y)
+
+    def _refresh_tile(self, x: int, y: int) -> None:
+        """Update the tile code of tile (x, y) to match the characters that
+        are currently on it.
+        """
+        chars = self._stored(x, y)
+        if not chars:
+            code = EMPTY_CODE
+        elif len(chars) == 2:
+            code = IN_CAN_CODE
+        else:
+            code = ord(chars[0].get_char())
+        self._set_code(x, y, code)
 
     def at(self, x: int, y: int) -> List[Character]:
         """Return the characters at tile (x, y).
@@ -191,14 +369,16 @@ class GameBoard:
         >>> b.at(0, 1)[0] == p
         True
         """
-        return self._board[y][x]
+        if not self.on_board(x, y):
+            return []
+        return self._row(y)[x]
 
-    def to_grid(self) -> List[List[chr]]:
+    def setup_from_grid(self, grid: str) -> None:
         """
-        Return the game state as a list of lists of chrs (letters) where:
+        Set the state of this GameBoard to correspond to the string <grid>,
+        which represents a game board using the following chars:
 
-        'R' = Raccoon
-        'S' = SmartRaccoon
+        'R' = Raccoon not in a GarbageCan
         'P' = Player
         'C' = closed GarbageCan
         'O' = open GarbageCan
@@ -206,105 +386,221 @@ class GameBoard:
         '@' = Raccoon in GarbageCan
         '-' = Empty tile
 
-        Each inner list represents one row of the game board.
+        There is a newline character between each board row. A '@' always
+        holds a plain Raccoon.
 
-        >>> b = GameBoard(3, 2)
-        >>> _ = Player(b, 0, 0)
-        >>> _ = Raccoon(b, 1, 1)
-        >>> _ = GarbageCan(b, 2, 1, True)
-        >>> b.to_grid()
-        [['P', '-', '-'], ['-', 'R', 'C']]
+        The board is filled in bulk by load_level, which raises a ValueError
+        if <grid> is not a valid level.
+
+        >>> b = GameBoard(4, 4)
+        >>> b.setup_from_grid('P-B-\\n-BRB\\n--BB\\n-C--')
+        >>> str(b)
+        'P-B-\\n-BRB\\n--BB\\n-C--'
         """
-        output = []
-        y = 0
-        for row in self._board:
-            temp = []
-            for x in range(len(row)):
-                if not self._board[y][x]:
-                    temp.append('-')
-                elif len(self._board[y][x]) == 2:
-                    temp.append('@')
-                else:
-                    temp.append(self._board[y][x][0].get_char())
-            y += 1
-            output.append(temp)
-        return output
-
-    def __str__(self) -> str:
+        self.load_level(grid.split('\n'))
+
+    def load_level(self, lines: Iterable[str]) -> None:
         """
-        Return a string representation of this board.
+        Set the state of this GameBoard to the level in <lines>, which has one
+        board row per line, written with the same chars as setup_from_grid.
 
-        The format is the same as expected by the setup_from_grid method.
+        <lines> may be an open file or any other iterable of strings. Line
+        endings are ignored, as are blank lines before the first row and after
+        the last row.
 
-        >>> b = GameBoard(3, 2)
-        >>> _ = Raccoon(b, 1, 1)
-        >>> print(b)
-        ---
-        -R-
-        >>> _ = Player(b, 0, 0)
-        >>> _ = GarbageCan(b, 2, 1, False)
-        >>> print(b)
-        P--
-        -RO
+        The level is read one line at a time, and the board is then filled in
+        bulk rather than by placing each character in turn. Raccoons are
+        added in the order of their tiles, row by row.
+
+        Raise a ValueError that names the line if a line contains a char that
+        is not in the level format or is not as long as the first line. The
+        board is left unchanged in that case.
+
+        >>> b = GameBoard(1, 1)
+        >>> b.load_level(['P-B-\\n', '-BRB\\n', '--BB\\n', '-C--\\n', '\\n'])
         >>> str(b)
-        'P--\\n-RO'
+        'P-B-\\n-BRB\\n--BB\\n-C--'
+        >>> b.load_level(['P-B-', '-BRX'])
+        Traceback (most recent call last):
+        ValueError: line 2, column 4: unknown tile 'X'
+        >>> b.load_level(['P-B-', '-BR'])
+        Traceback (most recent call last):
+        ValueError: line 2: expected 4 tiles but found 3
         """
-        output = ''
-        temp = self.to_grid()
-        for y in temp:
-            for x in y:
-                output += x
-            output += '\n'
-        return output.rstrip('\n')
+        width, codes = read_level(lines)
+        self._fill(width, len(codes) // width, occupied(codes))
 
-    def setup_from_grid(self, grid: str) -> None:
+    def _fill(self, width: int, height: int, tiles: Iterable[Tuple[int, int]],
+              raccoons: Optional[List[Tuple[int, type]]] = None) -> None:
+        """Reset this board to be <width> by <height> tiles, and fill it in
+        bulk with the tiles in <tiles>: the index and code of every tile that
+        is not empty, in order of index.
+
+        Raccoons take their turns in the order of their tiles, and '@' tiles
+        hold a plain Raccoon, as in setup_from_grid, unless <raccoons> gives
+        the index of the tile and the class of every Raccoon in turn order.
+        Only the Player is made here; every other character is made from its
+        tile code when its tile is first used.
+
+        Precondition:
+        - every code is the ord of a char in LEVEL_CHARS, other than '-'
+        - if <raccoons> is given, it gives every tile with a Raccoon on it
+          exactly once, with a class that matches the tile's code
         """
-        Set the state of this GameBoard to correspond to the string <grid>,
-        which represents a game board using the following chars:
+        rng, seed, debug = self.rng, self.seed, self.debug
+        grid, size = self._grid, (self.width, self.height)
+        viewed = self._viewed
+        self.__init__(width, height, seed)
+        self.rng, self.debug = rng, debug
+        if viewed and size == (width, height):
+            # refilled in place, so that observation views stay current
+            grid[:] = self._grid
+            self._grid, self._viewed = grid, True
+
+        movers = self._load_tiles(tiles)
+        if raccoons is None:
+            raccoons = [(i, SmartRaccoon if code == SMART_RACCOON_CODE
+                         else Raccoon) for i, code in movers
+                        if code != PLAYER_CODE]
+        for i, kind in raccoons:
+            self._roster.add(i, kind)
+            self._roster.count(self._grid[i], i, 1)
+        for i, code in movers:
+            if code == PLAYER_CODE:
+                Player(self, i % width, i // width)  # its code is already set
+
+    def raccoons(self) -> List[Raccoon]:
+        """Return the Raccoons on this board, in the order they take their
+        turns in.
+
+        >>> b = GameBoard(3, 1)
+        >>> b.setup_from_grid('S-@')
+        >>> [r.get_char() for r in b.raccoons()]
+        ['S', '@']
+        """
+        return [self._raccoon(rank) for rank in range(len(self._roster))]
 
-        'R' = Raccoon not in a GarbageCan
-        'P' = Player
-        'C' = closed GarbageCan
-        'O' = open GarbageCan
-        'B' = RecyclingBin
-        '@' = Raccoon in GarbageCan
-        '-' = Empty tile
+    def _raccoon(self, rank: int) -> Raccoon:
+        """Return the Raccoon that takes the <rank>th turn of each step."""
+        i = self._roster.tiles[rank]
+        return self.at(i % self.width, i // self.width)[-1]
 
-        There is a newline character between each board row.
+    def to_snapshot(self) -> bytes:
+        """Return the complete state of this game as bytes, from which
+        load_snapshot restores it exactly.
 
-        >>> b = GameBoard(4, 4)
-        >>> b.setup_from_grid('P-B-\\n-BRB\\n--BB\\n-C--')
-        >>> str(b)
-        'P-B-\\n-BRB\\n--BB\\n-C--'
+        Unlike str(self), a snapshot keeps the turn count, the state of this
+        board's random number generator, the Player's unprocessed event, the
+        order of the raccoons, and which raccoons inside cans are smart. The
+        format is described in racoon_raiders_snapshot.
+
+        Precondition:
+        - There is at most one Player on this board.
+        - 0 <= self.seed < 2 ** 64
+
+        >>> b = GameBoard(3, 2, 1)
+        >>> b.setup_from_grid('P-S\\n-RO')
+        >>> b.handle_event(RIGHT)
+        >>> b2 = GameBoard(1, 1)
+        >>> b2.load_snapshot(b.to_snapshot())
+        >>> print(b2)
+        P-S
+        -RO
+        >>> b2.give_turns()
+        >>> b2.char_at(1, 0)
+        'P'
+        """
+        event = NO_EVENT
+        if self._player is not None and \
+                self._player.pending_event() is not None:
+            event = DIRECTIONS.index(self._player.pending_event())
+        roster, width = self._roster, self.width
+        raccoons = [(i % width, i // width, SMART_RACCOON_CODE
+                     if issubclass(kind, SmartRaccoon) else RACCOON_CODE)
+                    for i, kind in zip(roster.tiles, roster.kinds)]
+        tiles, sparse = self._snapshot_tiles()
+        return pack_snapshot(Snapshot(
+            self.width, self.height, self.turns, self.seed, self.ended, event,
+            self.rng.getstate(), tiles, raccoons, sparse))
+
+    def _snapshot_tiles(self) -> Tuple[bytes, bool]:
+        """Return the tiles for to_snapshot, and whether they are sparse."""
+        return self._grid, False
+
+    def load_snapshot(self, data: bytes) -> None:
+        """Set the state of this GameBoard to the snapshot <data> made by
+        to_snapshot.
+
+        <data> may be any bytes-like object, such as bytes or an mmap, and is
+        read in place. The board is filled in bulk, as in load_level.
+
+        Raise a ValueError if <data> is not a valid snapshot. The board may be
+        left in any state in that case.
         """
-        lines = grid.split("\n")
-        width = len(lines[0])
-        height = len(lines)
-        self.__init__(width, height)  # reset the board to an empty board
-        y = 0
-        for line in lines:
-            x = 0
-            for char in line:
-                if char == 'R':
-                    Raccoon(self, x, y)
-                elif char == 'S':
-                    SmartRaccoon(self, x, y)
-                elif char == 'P':
-                    Player(self, x, y)
-                elif char == 'O':
-                    GarbageCan(self, x, y, False)
-                elif char == 'C':
-                    GarbageCan(self, x, y, True)
-                elif char == 'B':
-                    RecyclingBin(self, x, y)
-                elif char == '@':
-                    GarbageCan(self, x, y, False)
-                    Raccoon(self, x, y)  # always makes it a Raccoon
-                    # Note: the order mattered above, as we have to place the
-                    # Raccoon BEFORE the GarbageCan (see the place_character
-                    # method precondition)
-                x += 1
-            y += 1
+        with memoryview(data) as view:
+            snapshot = read_snapshot(view)
+            width = snapshot.width
+            raccoons = [(y * width + x, SmartRaccoon if kind ==
+                         SMART_RACCOON_CODE else Raccoon)
+                        for x, y, kind in snapshot.raccoons]
+            with snapshot.tiles:
+                self._fill(width, snapshot.height, snapshot_tiles(snapshot),
+                           raccoons)
+        try:
+            self.rng.setstate(snapshot.rng_state)
+        except (TypeError, ValueError) as error:
+            raise ValueError('snapshot has an invalid random number '
+                             'generator state') from error
+        self.turns = snapshot.turns
+        self.ended = snapshot.ended
+        self.seed = snapshot.seed
+        if snapshot.event != NO_EVENT:
+            self._player.record_event(DIRECTIONS[snapshot.event])
+
+    def clone(self) -> GameBoard:
+        """Return a copy of this game, of the same type as this board, that
+        can be played on without changing this one, for looking ahead at the
+        outcomes of moves.
+
+        The copy shares its tile codes and indexes with this board, and
+        each part of them is copied only once either board changes it. Its
+        Player is copied with any unprocessed event; every other character
+        is made when its tile is first used. Its random number generator
+        starts in the same state as this board's, and is not recorded.
+
+        Precondition:
+        - there is at most one Player on this board
+
+        >>> b = GameBoard(3, 2)
+        >>> b.setup_from_grid('PB-\\nR-O')
+        >>> c = b.clone()
+        >>> c.at(0, 0)[0].move(RIGHT)
+        True
+        >>> print(c)
+        -PB
+        R-O
+        >>> print(b)
+        PB-
+        R-O
+        """
+        other = type(self).__new__(type(self))
+        self._clone_tiles(other)
+        other.ended = self.ended
+        other.turns = self.turns
+        other.debug = self.debug
+        other.record = None
+        other.seed = self.seed
+        # the state is set directly, without seeding a generator first
+        other.rng = random.Random.__new__(type(self.rng))
+        other.rng.setstate(self.rng.getstate())
+        other._board = self._new_tiles()
+        other._player = None
+        if self._player is not None:
+            # the copy's tile gives it once the tile is used; see _unpack
+            player = _unplaced(Player, other, self._player.x, self._player.y)
+            player.record_event(self._player.pending_event())
+            other._player = player
+        return other
 
     # a helper method you may find useful in places
     def on_board(self, x: int, y: int) -> bool:
@@ -351,17 +647,129 @@ class GameBoard:
         self.turns += 1  # PROVIDED, DO NOT CHANGE
 
         if self.turns % RACCOON_TURN_FREQUENCY == 0:  # PROVIDED, DO NOT CHANGE
-            for raccoon in self._raccoons:
-                raccoon.take_turn()
+            self.step_raccoons()
 
         self.check_game_end()  # PROVIDED, DO NOT CHANGE
 
+    def advance(self, n: int) -> int:
+        """Play up to <n> turns with no new user input, stopping as soon as
+        the game has ended, and return how many turns were played.
+
+        The result is the same as calling give_turns <n> times, and stopping
+        once ended is True. Without user input nothing on the board changes
+        between the raccoons' turns, so after the first turn (in which the
+        Player responds to any event that is still waiting), this goes
+        straight from one raccoon turn to the next.
+
+        Precondition:
+        self._player is not None
+
+        >>> b = GameBoard(4, 3)
+        >>> p = Player(b, 0, 0)
+        >>> r = Raccoon(b, 1, 1)
+        >>> p.record_event(RIGHT)
+        >>> b.advance(RACCOON_TURN_FREQUENCY * 3 + 1)
+        61
+        >>> (p.x, p.y) == (1, 0)
+        True
+        """
+        start = self.turns
+        end = start + n
+        if n > 0:
+            self.give_turns()
+        while not self.ended and self.turns < end:
+            tick = (self.turns // RACCOON_TURN_FREQUENCY + 1) * \
+                RACCOON_TURN_FREQUENCY
+            if tick > end:
+                self.turns = end
+                break
+            self.turns = tick
+            self.step_raccoons()
+            self.check_game_end()
+        return self.turns - start
+
+    def play_events(self, events: Iterable[Optional[Tuple[int, int]]]) -> int:
+        """Play one turn for each of <events>, stopping as soon as the game
+        has ended, and return how many turns were played.
+
+        Each event is a direction that is handled (with handle_event) just
+        before its turn, or None for a turn with no user input. The result is
+        the same as doing this one turn at a time with give_turns, but runs
+        of turns with no user input are played with advance.
+
+        Precondition:
+        self._player is not None
+
+        >>> b = GameBoard(4, 1)
+        >>> p = Player(b, 0, 0)
+        >>> _ = Raccoon(b, 3, 0)
+        >>> b.play_events([RIGHT, None, RIGHT, RIGHT, None])
+        3
+        >>> b.ended
+        True
+        """
+        start = self.turns
+        idle = 0
+        for event in events:
+            if event is None:
+                idle += 1
+                continue
+            if idle:
+                self.advance(idle)
+                idle = 0
+                if self.ended:
+                    return self.turns - start
+            self.handle_event(event)
+            self.give_turns()
+            if self.ended:
+                return self.turns - start
+        self.advance(idle)
+        return self.turns - start
+
+    def step_raccoons(self) -> None:
+        """Give every Raccoon on this board one turn, in the order they were
+        placed.
+
+        The result, including which random numbers are drawn, is the same as
+        calling take_turn on each Raccoon in turn.
+
+        Only the active Raccoons are visited. A Raccoon or SmartRaccoon that
+        ends its turn inside a GarbageCan is never given a turn again, and
+        one that ends its turn trapped is put to sleep until one of its
+        neighbouring tiles is freed, since neither can move.
+
+        >>> b = GameBoard(3, 3)
+        >>> r = Raccoon(b, 2, 2)
+        >>> _ = GarbageCan(b, 0, 0, False)
+        >>> s = SmartRaccoon(b, 0, 2)
+        >>> b.step_raccoons()
+        >>> (r.x, r.y) in [(1, 2), (2, 1)]
+        True
+        >>> (s.x, s.y)
+        (0, 1)
+        """
+        roster = self._roster
+        for rank in roster.turns():
+            raccoon = self._raccoon(rank)
+            raccoon.take_turn()
+            # only these two kinds of Raccoon are known to stay put once
+            # they are inside a GarbageCan or trapped
+            if type(raccoon).take_turn in (Raccoon.take_turn,
+                                           SmartRaccoon.take_turn):
+                roster.schedule(rank, self._grid)
+            else:
+                roster.keep(rank)
+
     def handle_event(self, event: Tuple[int, int]) -> None:
         """Handle a user-input event.
 
         The board's Player records the event that happened, so that when the
         Player gets a turn, it can make the move that the user input indicated.
+
+        If this game is being recorded, the event is added to the recording.
         """
+        if self.record is not None:
+            self.record.add_event(self.turns, event)
         self._player.record_event(event)
 
     def check_game_end(self) -> Optional[int]:
@@ -401,26 +809,49 @@ class GameBoard:
         >>> b2.ended
         True
         """
-        c = 0
-        trapped = 0
         # Game will not end if there are no raccoons
-        if not self._raccoons:
+        roster = self._roster
+        if not roster:
             return None
 
-        for raccoon in self._raccoons:
-            if raccoon.check_trapped():
-                c += 1
-                trapped += 1
-            elif raccoon.inside_can:
-                c += 1
+        if self.debug:
+            assert (roster.trapped, roster.in_can) == self._scan_raccoons(), \
+                'trapped and inside-can counts are out of date'
+            assert self.state_hash == self.compute_state_hash(), \
+                'state_hash is out of date'
 
-        if c == len(self._raccoons):
+        if roster.trapped + roster.in_can == len(roster):
             self.ended = True
-            return 10 * trapped + self.adjacent_bin_score()
+            return 10 * roster.trapped + self.adjacent_bin_score()
         else:
             self.ended = False
             return None
 
+    def _scan_raccoons(self) -> Tuple[int, int]:
+        """Return the number of trapped Raccoons and the number of Raccoons
+        inside a GarbageCan, found by checking every Raccoon on this board.
+
+        This is the slow check that the counts kept by this board are
+        compared against in debug mode.
+
+        >>> b = GameBoard(3, 2)
+        >>> _ = Raccoon(b, 0, 0)
+        >>> _ = GarbageCan(b, 2, 1, False)
+        >>> _ = Raccoon(b, 2, 1)
+        >>> _ = RecyclingBin(b, 1, 0)
+        >>> _ = RecyclingBin(b, 0, 1)
+        >>> b._scan_raccoons()
+        (1, 1)
+        """
+        trapped = 0
+        in_can = 0
+        for raccoon in self.raccoons():
+            if raccoon.check_trapped():
+                trapped += 1
+            elif raccoon.inside_can:
+                in_can += 1
+        return trapped, in_can
+
     def adjacent_bin_score(self) -> int:
         """
         Return the size of the largest cluster of adjacent recycling bins
@@ -457,20 +888,8 @@ class GameBoard:
         >>> b.adjacent_bin_score()
         5
         """
-        # Return 0 if there are no recycling bins
-        if not self._recycling:
-            return 0
-
-        lengths = []
-        all_bins = self._recycling[:]
-        while all_bins != []:
-            bin1 = all_bins[0]
-            cluster = [bin1]
-            self.get_cluster(bin1.x, bin1.y, cluster)
-            lengths.append(len(cluster))
-            for c in cluster:
-                all_bins.remove(c)
-        return max(lengths)
+        # 0 if there are no recycling bins
+        return self._bins.largest(self._grid)
 
     def find_neighbour_bins(self, x: int, y: int) -> List[Character]:
         """Find every neighbour of the inputted <x> and <y> coordinate that
@@ -493,10 +912,9 @@ class GameBoard:
         for d in DIRECTIONS:
             new_x = x + d[0]
             new_y = y + d[1]
-            if self.on_board(new_x, new_y):
-                if (len(self.at(new_x, new_y)) == 1) and \
-                        (isinstance(self.at(new_x, new_y)[0], RecyclingBin)):
-                    neighbours.append(self.at(new_x, new_y)[0])
+            if self.on_board(new_x, new_y) and \
+                    self._grid[new_y * self.width + new_x] == BIN_CODE:
+                neighbours.append(self.at(new_x, new_y)[0])
         return neighbours
 
     def get_cluster(self, x: int, y: int, checked: List[Character]) -> None:
@@ -530,19 +948,26 @@ class GameBoard:
         >>> len(c) == 12
         True
         """
-        neighbours = self.find_neighbour_bins(x, y)
-        not_checked = []
-        for n in neighbours:
-            if n not in checked:
-                checked.append(n)
-                not_checked.append(n)
-
-        for n in not_checked:
-            self.get_cluster(n.x, n.y, checked)
+        seen = {(c.x, c.y) for c in checked}
+        to_visit = [(x, y)]
+        while to_visit:
+            x, y = to_visit.pop()
+            for n in self.find_neighbour_bins(x, y):
+                if (n.x, n.y) not in seen:
+                    seen.add((n.x, n.y))
+                    checked.append(n)
+                    to_visit.append((n.x, n.y))
 
     def find_can(self, x: int, y: int, direction: Tuple[int, int]) -> int:
         """Finds every open bin along the directions surrounding
         SmartRaccoon S
+
+        Return how many tiles away the nearest GarbageCan in <direction> is,
+        or -1 if there is none or something else is in the way. The nearest
+        tile in the way is found by a binary search of the row or column.
+
+        Precondition:
+        direction in DIRECTIONS
         >>> b = GameBoard(5, 5)
         >>> s = SmartRaccoon(b, 2, 2)
         >>> _ = GarbageCan(b, 0, 2, False)
@@ -558,19 +983,13 @@ class GameBoard:
         >>> b.find_can(s.x, s.y, DIRECTIONS[3])
         -1
         """
-        rows = self.to_grid()
-        counter = 1
-        x += direction[0]
-        y += direction[1]
-        while self.on_board(x, y):
-            if rows[y][x] == 'B' or rows[y][x] == 'R' or rows[y][x] == 'S' \
-                    or rows[y][x] == '@':
-                return -1
-            if rows[y][x] == 'C' or rows[y][x] == 'O':
-                return counter
-            x += direction[0]
-            y += direction[1]
-            counter += 1
+        distance = self._stops.nearest(x, y, direction)
+        if distance == -1:
+            return -1
+        x += direction[0] * distance
+        y += direction[1] * distance
+        if self._grid[y * self.width + x] in CAN_CODES:
+            return distance
         return -1
 
 
@@ -585,6 +1004,10 @@ class Character:
     Remember that the attributes are not inherited, but only exist once we call
     the __init__ of the parent class.
 
+    Characters have no instance dictionary, since large boards have a great
+    many of them; every subclass must list the attributes it adds in its own
+    __slots__.
+
     === Public Attributes ===
     board:
         the game board that this Character is on
@@ -594,6 +1017,7 @@ class Character:
     === Representation Invariants ===
     x, y are valid coordinates in board (i.e. board.on_board(x, y) is True)
     """
+    __slots__ = ('board', 'x', 'y')
     board: GameBoard
     x: int
     y: int
@@ -637,6 +1061,7 @@ class TurnTaker(Character):
 
     This class is abstract and should not be directly instantiated.
     """
+    __slots__ = ()
 
     def take_turn(self) -> None:
         """
@@ -653,6 +1078,7 @@ class RecyclingBin(Character):
     >>> rb.x, rb.y
     (2, 1)
     """
+    __slots__ = ()
 
     def move(self, direction: Tuple[int, int]) -> bool:
         """Move this recycling bin to tile:
@@ -666,6 +1092,10 @@ class RecyclingBin(Character):
         If the new tile is occupied by any other Character or if it
         is beyond the boundaries of the board, do nothing and return False.
 
+        A chain of bins is pushed by finding the first tile past the end of
+        the chain. If that tile is empty, the whole chain is shifted onto it
+        at once with GameBoard.shift_bins; otherwise nothing is changed.
+
         Precondition:
         direction in DIRECTIONS
 
@@ -678,22 +1108,19 @@ class RecyclingBin(Character):
         >>> b.at(0, 1) == [rb]
         True
         """
-        new_x = self.x + direction[0]
-        new_y = self.y + direction[1]
-        if self.board.on_board(new_x, new_y):
-            if not self.board.at(new_x, new_y):
-                self.board.move(self.x, self.y, new_x, new_y)
-                self.x = self.x + direction[0]
-                self.y = self.y + direction[1]
-                return True
-            elif isinstance(self.board.at(new_x, new_y)[0], RecyclingBin):
-                placeholder = self.board.at(new_x, new_y)[0].move(direction)
-                if placeholder is True:
-                    self.board.move(self.x, self.y, new_x, new_y)
-                    self.x = self.x + direction[0]
-                    self.y = self.y + direction[1]
-                    return True
-        return False
+        end_x = self.x + direction[0]
+        end_y = self.y + direction[1]
+        n = 1
+        while self.board.on_board(end_x, end_y) and \
+                self.board.char_at(end_x, end_y) == 'B':
+            end_x += direction[0]
+            end_y += direction[1]
+            n += 1
+        if not self.board.on_board(end_x, end_y) or \
+                self.board.char_at(end_x, end_y) != '-':
+            return False
+        self.board.shift_bins(self.x, self.y, direction, n)
+        return True
 
     def get_char(self) -> chr:
         """
@@ -722,6 +1149,7 @@ class Player(TurnTaker):
     # _last_event:
     #   The direction corresponding to the last keypress event that the user
     #   made, or None if there is currently no keypress event left to process
+    __slots__ = ('_last_event',)
     _last_event: Optional[Tuple[int, int]]
 
     def __init__(self, b: GameBoard, x: int, y: int) -> None:
@@ -731,6 +1159,12 @@ class Player(TurnTaker):
         TurnTaker.__init__(self, b, x, y)
         self._last_event = None
 
+    def pending_event(self) -> Optional[Tuple[int, int]]:
+        """Return the direction recorded by record_event that this Player
+        has not yet taken a turn for, or None if there is none.
+        """
+        return self._last_event
+
     def record_event(self, direction: Tuple[int, int]) -> None:
         """Record that <direction> is the last direction that the user
         has specified for this Player to move. Next time take_turn is called,
@@ -791,17 +1225,16 @@ class Player(TurnTaker):
         """
         new_x = self.x + direction[0]
         new_y = self.y + direction[1]
-        temp = self.board.to_grid()
+        if not self.board.on_board(new_x, new_y):
+            return False
+        target = self.board.char_at(new_x, new_y)
         placeholder = True
-        if not self.board.on_board(new_x, new_y) or temp[new_y][new_x] == 'R' \
-                or temp[new_y][new_x] == 'C' or temp[new_y][new_x] == 'S' \
-                or temp[new_y][new_x] == '@':
+        if target == 'R' or target == 'C' or target == 'S' or target == '@':
             return False
-        elif temp[new_y][new_x] == 'B':
+        elif target == 'B':
             placeholder = self.board.at(new_x, new_y)[0].move(direction)
-        elif temp[new_y][new_x] == 'O':
-            # noinspection PyUnresolvedReferences
-            self.board.at(new_x, new_y)[0].locked = True
+        elif target == 'O':
+            self.board.set_locked(new_x, new_y, True)
             return True
 
         if placeholder is True:
@@ -837,6 +1270,7 @@ class Raccoon(TurnTaker):
     >>> r.inside_can
     False
     """
+    __slots__ = ('inside_can',)
     inside_can: bool
 
     def __init__(self, b: GameBoard, x: int, y: int) -> None:
@@ -879,10 +1313,9 @@ class Raccoon(TurnTaker):
         for direction in DIRECTIONS:
             new_x = self.x + direction[0]
             new_y = self.y + direction[1]
-            temp = self.board.to_grid()
             if self.board.on_board(new_x, new_y):
-                if temp[new_y][new_x] == '-' or temp[new_y][new_x] == 'O' or \
-                        temp[new_y][new_x] == 'C':
+                char = self.board.char_at(new_x, new_y)
+                if char == '-' or char == 'O' or char == 'C':
                     return False
         return True
 
@@ -932,20 +1365,19 @@ class Raccoon(TurnTaker):
         """
         new_x = self.x + direction[0]
         new_y = self.y + direction[1]
-        temp = self.board.to_grid()
-        if not self.board.on_board(new_x, new_y) or temp[new_y][new_x] == 'P' \
-                or temp[new_y][new_x] == 'B':
+        if not self.board.on_board(new_x, new_y):
+            return False
+        target = self.board.char_at(new_x, new_y)
+        if target == 'P' or target == 'B':
             return False
-        elif temp[new_y][new_x] == 'R' or \
-                temp[new_y][new_x] == 'S' or temp[new_y][new_x] == '@':
+        elif target == 'R' or target == 'S' or target == '@':
             return False
-        elif temp[self.y][self.x] == '@':
+        elif self.board.char_at(self.x, self.y) == '@':
             return False
-        elif temp[new_y][new_x] == 'C':
-            # noinspection PyUnresolvedReferences
-            self.board.at(new_x, new_y)[0].locked = False
+        elif target == 'C':
+            self.board.set_locked(new_x, new_y, False)
             return True
-        elif temp[new_y][new_x] == 'O':
+        elif target == 'O':
             self.inside_can = True
 
         self.board.move(self.x, self.y, new_x, new_y)
@@ -959,7 +1391,9 @@ class Raccoon(TurnTaker):
         If a Raccoon is in a GarbageCan, it stays where it is.
 
         Otherwise, it randomly attempts (if it is not blocked) to move in
-        one of the four directions, with equal probability.
+        one of the four directions, with equal probability. A trapped Raccoon
+        does not attempt to move, so it does not use the board's random
+        number generator.
 
         >>> b = GameBoard(3, 4)
         >>> r1 = Raccoon(b, 0, 0)
@@ -974,12 +1408,11 @@ class Raccoon(TurnTaker):
         >>> r2.x, r2.y
         (2, 1)
         """
-        if len(self.board.at(self.x, self.y)) == 2:
+        if self.inside_can or self.check_trapped():
             return None
         temp = False
         counter = 0
-        random_dir = DIRECTIONS[:]
-        shuffle(random_dir)
+        random_dir = get_shuffled_directions(self.board.rng)
 
         while temp is False and counter < len(random_dir):
             temp = self.move(random_dir[counter])
@@ -1012,6 +1445,7 @@ class SmartRaccoon(Raccoon):
     >>> s.inside_can
     False
     """
+    __slots__ = ()
 
     def take_turn(self) -> None:
         """Take a turn in the game.
@@ -1044,7 +1478,7 @@ class SmartRaccoon(Raccoon):
         True
         """
         cans = []
-        if len(self.board.at(self.x, self.y)) == 2:
+        if self.inside_can:
             return None
         for d in DIRECTIONS:
             cans.append(self.board.find_can(self.x, self.y, d))
@@ -1076,6 +1510,10 @@ class GarbageCan(Character):
     locked:
         whether or not this GarbageCan is locked.
 
+    === Representation Invariants ===
+    Once this GarbageCan is on a board, locked is only changed through
+    GameBoard.set_locked.
+
     === Sample Usage ===
     >>> b = GameBoard(2, 2)
     >>> g = GarbageCan(b, 0, 0, False)
@@ -1084,6 +1522,7 @@ class GarbageCan(Character):
     >>> g.locked
     False
     """
+    __slots__ = ('locked',)
     locked: bool
 
     def __init__(self, b: GameBoard, x: int, y: int, locked: bool) -> None:
@@ -1091,8 +1530,10 @@ class GarbageCan(Character):
         whether it is locked or not based on <locked>.
         """
 
-        Character.__init__(self, b, x, y)
         self.locked = locked
+        # the board records whether this can is locked when it is placed, so
+        # locked must be set BEFORE calling the parent init
+        Character.__init__(self, b, x, y)
 
     def get_char(self) -> chr:
         """
@@ -1110,6 +1551,18 @@ class GarbageCan(Character):
         return False
 
 
+def _unplaced(cls: type, b: GameBoard, x: int, y: int) -> Character:
+    """Return a new character of type <cls> on board <b> at tile (x, y),
+    without calling its __init__ or placing it on the board.
+
+    The caller must set any other attributes of the character.
+    """
+    c = cls.__new__(cls)
+    c.board = b
+    c.x, c.y = x, y
+    return c
+
+
 # A helper function you may find useful for Task #5, depending on how
 # you implement it.
 def get_neighbours(tile: Tuple[int, int]) -> List[Tuple[int, int]]:
@@ -1136,7 +1589,10 @@ if __name__ == '__main__':
     python_ta.check_all(config={
         'allowed-io': [],
         'allowed-import-modules': ['doctest', 'python_ta', 'typing',
-                                   'random', '__future__', 'math'],
+                                   'random', '__future__', 'math', 'sys',
+                                   'racoon_raiders_grid',
+                                   'racoon_raiders_record',
+                                   'racoon_raiders_snapshot'],
         'disable': ['E1136'],
         'max-attributes': 15,
         'max-module-lines': 1600
@@ -22,9 +22,30 @@ any changes, are expressly prohibited.
 All of the files in this directory and all subdirectories are:
 Copyright (c) University of Toronto
 """
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
 from datetime import date
 from io import StringIO
+from typing import List
 from a1 import *
+from racoon_raiders_runner import ScriptedPolicy, play_game, read_levels, \
+    run_games
+import racoon_raiders_bench
+from racoon_raiders_bench import bench_level, compare, load_results, \
+    regressions, save_results
+from racoon_raiders_profiling import BoardProfiler
+from racoon_raiders_record import GameRecord
+import racoon_raiders_host
+from racoon_raiders_host import GameHost, level_boards
+from racoon_raiders_vector import ACTIONS, NO_ACTION, VectorEnv
+from racoon_raiders_solver import ADVERSARY, EXPECTATION, evaluate, solve
+from racoon_raiders_snapshot import SNAPSHOT_HEADER, SNAPSHOT_RNG, \
+    load_snapshot_file, save_snapshot
+from racoon_raiders_compact import CompactGameBoard, SparseGameBoard
 
 # A string representing a simple 4 by 4 game board.
 # We use this in one of the tests below. You can use it in your own testing, but
@@ -32,6 +53,19 @@ from a1 import *
 SIMPLE_BOARD_STRING = 'P-B-\n-BRB\n--BB\n-C--'
 
 
+# A string representing an 8 by 5 game board with every kind of character,
+# where SmartRaccoons can end up inside GarbageCans. The tests of the board's
+# indexes, formats and turns use it.
+BUSY_BOARD_STRING = 'P-B--R-R\nOBRB-OSC\nR-BBC-RS\n-C-S--R-\nR-O-BB-R'
+
+# The board in BUSY_BOARD_STRING, but with a Raccoon already inside a
+# GarbageCan, and no open GarbageCan next to a SmartRaccoon.
+BUSY_BOARD_IN_CAN_STRING = 'P-B--R-R\nOBRB-O-C\nR-BBC-RS\n-C-S--R-\nR-@-BB-R'
+
+# Every kind of board, which the tests of the board's features are run on.
+BOARD_TYPES = [GameBoard, CompactGameBoard, SparseGameBoard]
+
+
 def simple_board_setup() -> GameBoard:
     """Set up a simple game board"""
     b = GameBoard(4, 4)
@@ -39,6 +73,19 @@ def simple_board_setup() -> GameBoard:
     return b
 
 
+def busy_boards_setup(seed: int, grid: str = BUSY_BOARD_STRING,
+                      board_types: List[type] = BOARD_TYPES) \
+        -> List[GameBoard]:
+    """Set up a board of each type in <board_types> with <grid>, with their
+    random number generators seeded with <seed>."""
+    boards = []
+    for board_type in board_types:
+        b = board_type(1, 1, seed)
+        b.setup_from_grid(grid)
+        boards.append(b)
+    return boards
+
+
 def test_simple_place_character() -> None:
     """Test GameBoard.place_character by placing a single Raccoon."""
     b = GameBoard(3, 2)
@@ -179,6 +226,815 @@ def test_simple_give_turns() -> None:
     assert (p.x, p.y) == (1, 0)  # Player moved right!
 
 
+def test_simple_char_at() -> None:
+    """Test that GameBoard.char_at agrees with to_grid as characters move."""
+    b = GameBoard(4, 2)
+    p = Player(b, 0, 0)
+    r = Raccoon(b, 3, 1)
+    g = GarbageCan(b, 2, 1, True)
+    RecyclingBin(b, 1, 0)
+    assert b.char_at(2, 1) == 'C'
+    assert r.move(LEFT)  # unlocks the can
+    assert b.char_at(2, 1) == 'O'
+    assert r.move(LEFT)
+    assert b.char_at(2, 1) == '@' and b.char_at(3, 1) == '-'
+    assert p.move(RIGHT)  # pushes the bin
+    assert b.char_at(1, 0) == 'P' and b.char_at(2, 0) == 'B'
+    assert not g.locked
+    grid = b.to_grid()
+    for y in range(b.height):
+        for x in range(b.width):
+            assert b.char_at(x, y) == grid[y][x]
+
+
+def test_check_game_end_counts_match_scan() -> None:
+    """Test that the counts used by GameBoard.check_game_end stay equal to a
+    full scan of the raccoons while a game is played."""
+    b = GameBoard(6, 5)
+    b.setup_from_grid('P-B--R\n-BRB-O\n--BBC-\n-C-S--\nR-@-BB')
+    b.debug = True
+    moves = [RIGHT, DOWN, DOWN, RIGHT, UP, LEFT, DOWN, RIGHT, RIGHT, UP]
+    for i in range(RACCOON_TURN_FREQUENCY * 10):
+        b.handle_event(moves[i % len(moves)])
+        b.give_turns()  # check_game_end fails if the counts are wrong
+
+
+def test_raccoon_placed_in_can() -> None:
+    """Test that a Raccoon placed on an open GarbageCan is inside it."""
+    b = GameBoard(2, 1)
+    b.setup_from_grid('@P')
+    assert b.at(0, 0)[1].inside_can
+    assert b.check_game_end() == 0
+
+
+def test_adjacent_bin_score_after_pushes() -> None:
+    """Test that GameBoard.adjacent_bin_score stays correct as the Player
+    pushes RecyclingBins apart and together."""
+    b = GameBoard(6, 3)
+    b.setup_from_grid('BB-BB-\nPBBB--\n------')
+    assert b.adjacent_bin_score() == 7
+    p = b.at(0, 1)[0]
+    assert p.move(RIGHT)  # splits the cluster into 5 + 2
+    assert b.adjacent_bin_score() == 5
+    assert p.move(DOWN)
+    assert p.move(RIGHT)
+    assert p.move(UP)  # pushes the bin at (2, 1) up, joining the clusters
+    assert str(b) == 'BBBBB-\n--PBB-\n------'
+    assert b.adjacent_bin_score() == 7
+
+
+def test_adjacent_bin_score_large_cluster() -> None:
+    """Test GameBoard.adjacent_bin_score on a cluster too large to search
+    recursively."""
+    b = GameBoard(1, 1)
+    b.setup_from_grid('\n'.join(['B' * 120] * 120))
+    assert b.adjacent_bin_score() == 120 * 120
+    c = [b.at(0, 0)[0]]
+    b.get_cluster(0, 0, c)
+    assert len(c) == 120 * 120
+
+
+def test_find_can_after_moves() -> None:
+    """Test that GameBoard.find_can sees through the Player and follows
+    characters as they move."""
+    b = GameBoard(7, 3)
+    b.setup_from_grid('O-P-S-C\n---B---\n---O---')
+    assert b.find_can(4, 0, LEFT) == 4  # the Player does not block sight
+    assert b.find_can(4, 0, RIGHT) == 2
+    assert b.find_can(3, 0, DOWN) == -1  # the RecyclingBin is in the way
+    assert b.at(3, 1)[0].move(LEFT)
+    assert b.find_can(3, 0, DOWN) == 2
+    assert b.find_can(2, 1, RIGHT) == -1
+    assert b.find_can(0, 2, UP) == 2
+
+
+def test_compact_board_matches_board() -> None:
+    """Test that a CompactGameBoard plays exactly like a GameBoard."""
+    grid = 'P-B--R\nOBRB-O\n--BBC-\n-C-S--\nR-@-BB'
+    boards = [GameBoard(1, 1), CompactGameBoard(1, 1)]
+    for b in boards:
+        b.setup_from_grid(grid)
+    moves = [RIGHT, DOWN, DOWN, RIGHT, UP, LEFT, DOWN, RIGHT, RIGHT, UP]
+    for move in moves:
+        for b in boards:
+            b.handle_event(move)
+            b.give_turns()
+        assert str(boards[0]) == str(boards[1])
+    assert boards[1].at(0, 0) == []
+    assert boards[1].check_game_end() == boards[0].check_game_end()
+
+
+def test_step_raccoons_matches_take_turn() -> None:
+    """Test that GameBoard.step_raccoons gives the same result as calling
+    take_turn on every raccoon, for the same board seed."""
+    stepped, one_by_one = busy_boards_setup(148, BUSY_BOARD_IN_CAN_STRING,
+                                            [GameBoard, GameBoard])
+    for _ in range(20):
+        stepped.step_raccoons()
+        for raccoon in one_by_one.raccoons():
+            raccoon.take_turn()
+        assert str(stepped) == str(one_by_one)
+
+
+def test_play_game_scripted() -> None:
+    """Test play_game with a scripted Player that traps the raccoon."""
+    result = play_game('P--\n-BR\n--B', ScriptedPolicy([RIGHT] * 2), 0)
+    assert result.turns == 2
+    assert result.ended
+    assert result.score == 11
+    assert result.trapped == 1
+
+
+def test_run_games_same_in_every_process_count() -> None:
+    """Test that run_games streams the same results in order whether the
+    games are played in this process or in a pool."""
+    corpus = '\n'.join(['P-B--R\nOBRB-O\n--BBC-\n-C-S--\nR-@-BB\n',
+                        'P-R\n-B-\nR-O\n'] * 5)
+    levels = list(read_levels(StringIO(corpus)))
+    assert len(levels) == 10
+    state = random.getstate()
+    in_process = list(run_games(levels, seed=3, max_turns=200, processes=0))
+    assert random.getstate() == state
+    pooled = list(run_games(iter(levels), seed=3, max_turns=200,
+                            processes=2, chunk_size=3))
+    assert in_process == pooled
+    assert [r.index for r in pooled] == list(range(10))
+
+
+def test_board_seed_repeats_game() -> None:
+    """Test that two boards with the same seed play the same game, whatever
+    the module-level random number generator does."""
+    boards = busy_boards_setup(5, BUSY_BOARD_IN_CAN_STRING,
+                               [GameBoard, CompactGameBoard])
+    for b in boards:
+        for _ in range(RACCOON_TURN_FREQUENCY * 10):
+            get_shuffled_directions()  # draws from the module-level generator
+            b.give_turns()
+    assert str(boards[0]) == str(boards[1])
+
+
+def test_game_record_replay() -> None:
+    """Test that a recorded game replays to the same final board, also after
+    being encoded as bytes."""
+    record = GameRecord(BUSY_BOARD_IN_CAN_STRING, 42)
+    b = record.start()
+    moves = [RIGHT, DOWN, DOWN, RIGHT, UP, LEFT, DOWN, RIGHT, RIGHT, UP]
+    for i in range(RACCOON_TURN_FREQUENCY * 12):
+        if i % 3 == 0:
+            b.handle_event(moves[i % len(moves)])
+        b.give_turns()
+    record.finish(b)
+    assert record.final == str(b)
+    assert record.verify()
+    data = record.to_bytes()
+    assert len(data) < 40 + len(record.grid) + len(record.final) + 100
+    copy = GameRecord.from_bytes(data)
+    assert copy.events == record.events
+    assert copy.verify(CompactGameBoard)
+    copy.seed += 1
+    assert not copy.verify()
+    for bad in [data[:25], data[:-1], data + b'\x00', b'RRG2' + data[4:]]:
+        try:
+            GameRecord.from_bytes(bad)
+        except ValueError:
+            pass
+        else:
+            assert False, 'expected a ValueError'
+
+
+def test_out_of_range_seeds() -> None:
+    """Test that games with a negative seed or a seed of more than 64 bits
+    can be recorded and snapshotted."""
+    for seed in [-1, -42, 2 ** 64 + 5, 2 ** 70]:
+        record = GameRecord('P-B--R\n-B-R-O', seed)
+        b = record.start()
+        assert b.seed == record.seed == seed % 2 ** 64
+        for i in range(RACCOON_TURN_FREQUENCY * 3):
+            b.handle_event([RIGHT, DOWN, LEFT, UP][i % 4])
+            b.give_turns()
+        record.finish(b)
+        copy = GameRecord.from_bytes(record.to_bytes())
+        assert copy.seed == record.seed and copy.verify()
+        b2 = GameBoard(1, 1)
+        b2.load_snapshot(GameBoard(2, 2, seed).to_snapshot())
+        assert b2.seed == seed % 2 ** 64
+
+
+def test_characters_have_no_dict() -> None:
+    """Test that characters are slotted and keep working on a compact board."""
+    b = CompactGameBoard(3, 2)
+    chars = [Player(b, 0, 0), Raccoon(b, 1, 0), SmartRaccoon(b, 2, 0),
+             GarbageCan(b, 0, 1, False), RecyclingBin(b, 1, 1)]
+    for c in chars:
+        assert not hasattr(c, '__dict__')
+    r = Raccoon(b, 0, 1)
+    assert r.inside_can
+    assert b.at(0, 1) == [chars[3], r]
+    assert chars[4].move(RIGHT)
+    assert b.at(2, 1) == [chars[4]]
+    assert str(b) == 'PRS\n@-B'
+
+
+def test_sparse_board_matches_board() -> None:
+    """Test that a SparseGameBoard plays exactly like a GameBoard and only
+    stores the tiles that differ from an empty board."""
+    boards = busy_boards_setup(9, BUSY_BOARD_IN_CAN_STRING,
+                               [GameBoard, SparseGameBoard])
+    moves = [RIGHT, DOWN, DOWN, RIGHT, UP, LEFT, DOWN, RIGHT, RIGHT, UP]
+    for b in boards:
+        for i in range(RACCOON_TURN_FREQUENCY * 10):
+            b.handle_event(moves[i % len(moves)])
+            b.give_turns()
+    assert str(boards[0]) == str(boards[1])
+    assert boards[0].check_game_end() == boards[1].check_game_end()
+    huge = SparseGameBoard(10 ** 5, 10 ** 5)
+    assert huge.memory_usage() == SparseGameBoard(1, 1).memory_usage()
+
+
+def test_sparse_board_huge() -> None:
+    """Test that a huge SparseGameBoard can be created and played on."""
+    b = SparseGameBoard(100000, 100000)
+    p = Player(b, 0, 0)
+    r = Raccoon(b, 99999, 99999)
+    RecyclingBin(b, 99998, 99999)
+    assert not r.check_trapped()
+    RecyclingBin(b, 99999, 99998)
+    assert r.check_trapped()
+    assert b.check_game_end() == 10 + 1
+    assert p.move(RIGHT) and b.at(1, 0) == [p]
+
+
+def _place_characters(b: GameBoard, grid: str) -> None:
+    """Place the characters of the level <grid> on the empty board <b> one at
+    a time, in the order of their tiles."""
+    kinds = {'R': Raccoon, 'S': SmartRaccoon, 'P': Player, 'B': RecyclingBin,
+             '@': Raccoon}
+    for y, line in enumerate(grid.split('\n')):
+        for x, char in enumerate(line):
+            if char in 'OC@':
+                GarbageCan(b, x, y, char == 'C')
+            if char in kinds:
+                kinds[char](b, x, y)
+
+
+def test_load_level_matches_placed_characters() -> None:
+    """Test that GameBoard.load_level, reading a file, sets up the same game
+    as placing each character in turn."""
+    grid = BUSY_BOARD_IN_CAN_STRING
+    for board_type in BOARD_TYPES:
+        loaded = board_type(1, 1, 4)
+        loaded.load_level(StringIO(grid + '\n'))
+        loaded.debug = True
+        setup = GameBoard(8, 5, 4)
+        _place_characters(setup, grid)
+        assert str(loaded) == str(setup)
+        assert [type(r) for r in loaded.raccoons()] == \
+            [type(r) for r in setup.raccoons()]
+        for i in range(RACCOON_TURN_FREQUENCY * 10):
+            for b in [loaded, setup]:
+                b.handle_event(DIRECTIONS[i % 4])
+                b.give_turns()
+            assert str(loaded) == str(setup)
+        assert loaded.check_game_end() == setup.check_game_end()
+        assert loaded.adjacent_bin_score() == setup.adjacent_bin_score()
+
+
+def test_load_level_errors() -> None:
+    """Test that GameBoard.load_level reports bad levels by line number and
+    leaves the board unchanged."""
+    b = GameBoard(1, 1)
+    b.setup_from_grid('P-\nRB')
+    for lines, message in [(['P--', 'R-', ''], 'line 2: expected 3'),
+                           (['P-', 'R?'], 'line 2, column 2'),
+                           (['P-', '', 'R-'], 'line 2: blank line'),
+                           (['', '\n', 'P-', '', 'R-'], 'line 4: blank line'),
+                           ([], 'the level has no rows')]:
+        try:
+            b.load_level(lines)
+        except ValueError as error:
+            assert str(error).startswith(message)
+        else:
+            assert False, 'expected a ValueError'
+    assert str(b) == 'P-\nRB'
+    b.load_level(['\n', '', 'R-\n', '-P\n', '\n'])
+    assert str(b) == 'R-\n-P'
+
+
+def test_snapshot_round_trip() -> None:
+    """Test that a snapshot restores a game exactly, including its random
+    number generator, pending event and SmartRaccoons inside cans."""
+    b = busy_boards_setup(11, board_types=[CompactGameBoard])[0]
+    for i in range(RACCOON_TURN_FREQUENCY * 3 + 5):
+        b.handle_event(DIRECTIONS[i % 4])
+        b.give_turns()
+    assert any(isinstance(r, SmartRaccoon) and r.inside_can
+               for r in b.raccoons())
+    b.handle_event(DOWN)
+    data = b.to_snapshot()
+    copies = []
+    for board_type in BOARD_TYPES:
+        copy = board_type(1, 1)
+        copy.load_snapshot(data)
+        assert str(copy) == str(b)
+        assert copy.turns == b.turns
+        again = CompactGameBoard(1, 1)
+        again.load_snapshot(copy.to_snapshot())
+        assert again.to_snapshot() == data
+        copies.append(copy)
+    for board in [b] + copies:
+        board.give_turns()  # the pending DOWN event
+        for i in range(RACCOON_TURN_FREQUENCY * 5):
+            board.handle_event(DIRECTIONS[i % 3])
+            board.give_turns()
+    for copy in copies:
+        assert str(copy) == str(b)
+        assert copy.rng.getstate() == b.rng.getstate()
+
+
+def _with_event(data: bytes, event: int) -> bytes:
+    """Return the snapshot <data> with its Player's event set to <event>."""
+    header = list(SNAPSHOT_HEADER.unpack_from(data))
+    header[7] = event
+    return SNAPSHOT_HEADER.pack(*header) + data[SNAPSHOT_HEADER.size:]
+
+
+def test_snapshot_file_and_errors() -> None:
+    """Test saving a snapshot to a file and loading it memory-mapped, and
+    that bad snapshots are rejected."""
+    b = GameBoard(1, 1, 3)
+    b.setup_from_grid('P-B-\n-BSB\n--BB\n-C--')
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'game.rrs')
+        save_snapshot(b, path)
+        copy = SparseGameBoard(1, 1)
+        load_snapshot_file(copy, path)
+    assert str(copy) == str(b)
+    data = b.to_snapshot()
+    no_player = GameBoard(1, 1)
+    no_player.setup_from_grid('-B\nR-')
+    rng_end = SNAPSHOT_HEADER.size + SNAPSHOT_RNG.size
+    for bad in [data[:-1], b'XXXX' + data[4:], data[:20],
+                _with_event(data, 7), _with_event(no_player.to_snapshot(), 0),
+                data[:rng_end - 4] + (9999).to_bytes(4, 'little') +
+                data[rng_end:]]:
+        try:
+            GameBoard(1, 1).load_snapshot(bad)
+        except ValueError:
+            pass
+        else:
+            assert False, 'expected a ValueError'
+
+
+def test_sparse_snapshot() -> None:
+    """Test that a huge SparseGameBoard's snapshot only stores the tiles that
+    are not empty, and that bad sparse snapshots are rejected."""
+    b = SparseGameBoard(20000, 20000, 5)
+    Player(b, 0, 0)
+    SmartRaccoon(b, 19999, 19999)
+    GarbageCan(b, 19998, 19999, False)
+    b.handle_event(RIGHT)
+    data = b.to_snapshot()
+    assert len(data) < SNAPSHOT_HEADER.size + SNAPSHOT_RNG.size + 100
+    copy = SparseGameBoard(1, 1)
+    copy.load_snapshot(data)
+    assert copy.to_snapshot() == data
+    for board in [b, copy]:
+        for i in range(RACCOON_TURN_FREQUENCY * 2):
+            board.give_turns()
+            board.handle_event(DIRECTIONS[i % 4])
+    assert copy.to_snapshot() == b.to_snapshot()
+    start = SNAPSHOT_HEADER.size + SNAPSHOT_RNG.size
+    first, second = data[start:start + 9], data[start + 9:start + 18]
+    for bad in [data[:start] + second + first + data[start + 18:],
+                data[:start] + (4 * 10 ** 8).to_bytes(8, 'little') +
+                data[start + 8:],
+                data[:start + 8] + b'-' + data[start + 9:],
+                data[:-1]]:
+        try:
+            SparseGameBoard(1, 1).load_snapshot(bad)
+        except ValueError:
+            pass
+        else:
+            assert False, 'expected a ValueError'
+
+
+def test_clone_plays_like_original() -> None:
+    """Test that a clone plays out exactly like the board it was cloned from,
+    without changing that board."""
+    for b in busy_boards_setup(21):
+        for i in range(25):
+            b.handle_event(DIRECTIONS[i % 4])
+            b.give_turns()
+        before = b.to_snapshot()
+        copy = b.clone()
+        assert str(copy) == str(b)
+        for board in [copy, b]:
+            for i in range(RACCOON_TURN_FREQUENCY * 4):
+                board.handle_event(DIRECTIONS[(i * 7) % 4])
+                board.give_turns()
+            if board is copy:
+                assert b.to_snapshot() == before
+        assert copy.to_snapshot() == b.to_snapshot()
+        assert copy.adjacent_bin_score() == b.adjacent_bin_score()
+
+
+def test_clones_share_until_changed() -> None:
+    """Test that a board and its clones, which share their tiles until they
+    change them, can be played on in turn without changing each other."""
+    for b in busy_boards_setup(6):
+        boards = [b, b.clone(), b.clone()]
+        twins = []
+        for board in boards:
+            twin = type(board)(1, 1)
+            twin.load_snapshot(board.to_snapshot())
+            twins.append(twin)
+        for i in range(RACCOON_TURN_FREQUENCY * 3):
+            for k, board in enumerate(boards + twins):
+                board.handle_event(DIRECTIONS[(i * (k % 3 + 1)) % 4])
+                board.give_turns()
+        for board, twin in zip(boards, twins):
+            assert board.to_snapshot() == twin.to_snapshot()
+            assert board.state_hash == board.compute_state_hash()
+            assert board.trapped_raccoons() == twin.trapped_raccoons()
+            assert board.adjacent_bin_score() == twin.adjacent_bin_score()
+
+
+def test_solver_plans() -> None:
+    """Test that the solver's plans end the game with the score it reports."""
+    grid = 'P-----\n--B---\n-----R'
+    for mode in [EXPECTATION, ADVERSARY]:
+        solution = solve(grid, range(3), mode, max_turns=40, processes=0)
+        assert solution is not None
+        scores = evaluate(grid, solution.moves, range(3))
+        assert solution.ended == 1.0
+        if mode == EXPECTATION:
+            assert solution.score == sum(scores) / 3
+        else:
+            assert solution.score == min(scores)
+
+
+def test_state_hash() -> None:
+    """Test that state_hash stays equal to a full recompute, and only depends
+    on what is on the board."""
+    for b in busy_boards_setup(4):
+        for i in range(RACCOON_TURN_FREQUENCY * 3):
+            b.handle_event(DIRECTIONS[(i * 5) % 4])
+            b.give_turns()
+            assert b.state_hash == b.compute_state_hash()
+        same = GameBoard(1, 1)
+        same.load_level(str(b).split('\n'))
+        assert same.state_hash == b.state_hash
+        assert b.clone().state_hash == b.state_hash
+
+
+def test_trapped_raccoon_sleeps_until_freed() -> None:
+    """Test that a trapped Raccoon draws no random numbers, and moves again
+    once a neighbouring tile is freed."""
+    b = GameBoard(1, 1, 8)
+    b.setup_from_grid('---\nBPB\nBRB\n-B-')
+    r = b.at(1, 2)[0]
+    state = b.rng.getstate()
+    b.step_raccoons()
+    assert b.rng.getstate() == state
+    assert (r.x, r.y) == (1, 2)
+    assert b.at(1, 1)[0].move(UP)
+    b.step_raccoons()
+    assert (r.x, r.y) == (1, 1)
+
+
+def test_advance_and_play_events() -> None:
+    """Test that advance and play_events end in the same state as playing
+    the same turns one at a time with give_turns."""
+    events = [RIGHT, None, None, DOWN] + [None] * 50 + [LEFT, UP] * 5
+    fast, slow = busy_boards_setup(9, board_types=[GameBoard, GameBoard])
+    assert fast.play_events(events) == len(events)
+    assert fast.advance(95) == 95
+    for event in events + [None] * 95:
+        if event is not None:
+            slow.handle_event(event)
+        slow.give_turns()
+    assert fast.to_snapshot() == slow.to_snapshot()
+
+
+def test_board_profiler() -> None:
+    """Test that a BoardProfiler counts the phases of a game and the pushes
+    of the Player, and leaves the board as it was when it stops."""
+    b = busy_boards_setup(2, board_types=[GameBoard])[0]
+    with BoardProfiler(b) as profiler:
+        b.play_events([RIGHT, RIGHT, DOWN] + [None] * RACCOON_TURN_FREQUENCY)
+        str(b)
+    assert vars(b).keys().isdisjoint(['give_turns', 'shift_bins', 'to_grid'])
+    snapshot = json.loads(json.dumps(profiler.snapshot()))
+    phases = snapshot['phases']
+    assert phases['turn']['calls'] == 4
+    assert phases['raccoons']['calls'] == 1
+    assert phases['grid']['calls'] == 1
+    assert snapshot['push_chains'] == {'1': 1}
+    assert snapshot['memory'] == b.memory_usage() > 0
+
+
+def test_benchmark_results_compare() -> None:
+    """Test that benchmark results survive being saved, and that a slower
+    run is flagged as a regression."""
+    results = bench_level(CompactGameBoard, 10, 'dense', repeat=1)
+    assert len({r.operation for r in results}) == len(results)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'bench.json')
+        save_results(results, path)
+        assert load_results(path) == results
+    slower = [r._replace(seconds=r.seconds * 2) for r in results[:3]]
+    changes = compare(results, slower)
+    assert len(changes) == 3
+    assert regressions(changes) == changes
+    assert regressions(compare(results, results)) == []
+
+
+def test_benchmark_times_its_board_type() -> None:
+    """Test that every operation benchmarked for a board type is timed on a
+    board of exactly that type."""
+    best = racoon_raiders_bench._best
+    timed = []
+
+    def spy(repeat, setup, run, calls=1):
+        subject = setup()
+        if isinstance(subject, GameBoard):
+            timed.append(type(subject))
+        return best(repeat, setup, run, calls)
+
+    racoon_raiders_bench._best = spy
+    try:
+        for board_type in [GameBoard, CompactGameBoard]:
+            timed.clear()
+            bench_level(board_type, 10, 'dense', repeat=1)
+            assert len(timed) == 7
+            assert set(timed) == {board_type}
+    finally:
+        racoon_raiders_bench._best = best
+
+
+def test_push_long_chain_of_bins() -> None:
+    """Test that the Player can push a chain of thousands of bins, and that
+    a chain against the wall is left alone."""
+    n = 5000
+    b = CompactGameBoard(1, 1)
+    b.setup_from_grid('P' + 'B' * n + '--\n' + '-' * (n + 3))
+    first = b.at(1, 0)[0]
+    for board in [b.clone(), b]:
+        player = board.at(0, 0)[0]
+        assert player.move(RIGHT)
+        assert player.move(RIGHT)
+        assert str(board).split('\n')[0] == '--P' + 'B' * n
+        assert board.adjacent_bin_score() == n
+        assert not player.move(RIGHT)
+        assert board.state_hash == board.compute_state_hash()
+    assert (first.x, first.y) == (3, 0)
+    assert b.at(n + 2, 0)[0].x == n + 2
+
+
+def test_game_host_sessions() -> None:
+    """Test that a GameHost plays a separate game for each client connected
+    over TCP, one move per tick."""
+    async def play() -> list:
+        host = GameHost(level_boards('PB-R\n---B'))
+        server = await host.serve_tcp()
+        port = server.sockets[0].getsockname()[1]
+        clients = [await asyncio.open_connection('127.0.0.1', port)
+                   for _ in range(2)]
+        lines = []
+        for (reader, writer), commands in zip(clients, [b'R', b'D\nS']):
+            # the host has read the commands once it answers the X
+            writer.write(commands + b'\nX\n')
+            lines.append((await reader.readline()).decode().strip())
+            lines.append((await reader.readline()).decode().strip())
+        await host.tick()
+        await host.tick()
+        lines.append((await clients[0][0].read()).decode().split('\n'))
+        for _ in range(2):
+            lines.append((await clients[1][0].readline()).decode().strip())
+        lines.append(sorted(host.sessions))
+        host.stop()
+        return lines
+
+    lines = asyncio.run(play())
+    assert lines[:4] == ['WELCOME 0', "ERROR unknown command 'X'",
+                         'WELCOME 1', "ERROR unknown command 'X'"]
+    assert lines[4] == ['TURN 1', 'END 11', '']
+    assert lines[5:] == ['TURN 1', 'BOARD -B-R/P--B', [1]]
+
+
+def test_game_host_sessions_closed_mid_tick() -> None:
+    """Test that a GameHost tick ends cleanly when every session is closed
+    while it is running."""
+    async def play() -> list:
+        host = GameHost(level_boards('P--\n--R'))
+        server = await host.serve_tcp()
+        port = server.sockets[0].getsockname()[1]
+        clients = [await asyncio.open_connection('127.0.0.1', port)
+                   for _ in range(2)]
+        for reader, _ in clients:
+            await reader.readline()
+        turns = []
+
+        def play_turn(session) -> None:
+            # the first game ends, and the other client leaves meanwhile
+            turns.append(session.id)
+            for session_id in list(host.sessions):
+                host._close(session_id)
+
+        host._play_turn = play_turn
+        await host.tick()
+        remaining = sorted(host.sessions)
+        host.stop()
+        return [turns, remaining]
+
+    assert asyncio.run(play()) == [[0], []]
+
+
+def test_game_host_slow_turns_off_loop() -> None:
+    """Test that a GameHost plays the turns of a slow game in a worker
+    thread, while the other games go on."""
+    # the host's clock only moves when the slow turn moves it
+    now = [0.0]
+    release = threading.Event()
+
+    def new_board(session_id: int) -> GameBoard:
+        board = level_boards('P--\n--R')(session_id)
+        if session_id == 0:
+            give_turns = board.give_turns
+
+            def slow_turns() -> None:
+                release.wait(5)
+                now[0] += 0.3
+                give_turns()
+            board.give_turns = slow_turns
+        return board
+
+    async def play() -> list:
+        host = GameHost(new_board)
+        server = await host.serve_tcp()
+        port = server.sockets[0].getsockname()[1]
+        clients = [await asyncio.open_connection('127.0.0.1', port)
+                   for _ in range(2)]
+        for reader, _ in clients:
+            await reader.readline()
+        slow, fast = host.sessions[0], host.sessions[1]
+        slow.turn_seconds = 1.0
+        # the slow turn cannot finish until these ticks are done
+        for _ in range(10):
+            await host.tick()
+        during = [slow.busy, slow.board.turns, fast.board.turns]
+        release.set()
+        while slow.busy:
+            await asyncio.sleep(0.01)
+        after = [slow.board.turns, slow.idle_ticks]
+        host.stop()
+        return during + after
+
+    clock = racoon_raiders_host.perf_counter
+    racoon_raiders_host.perf_counter = lambda: now[0]
+    try:
+        assert asyncio.run(play()) == [True, 0, 10, 1, 60]
+    finally:
+        release.set()
+        racoon_raiders_host.perf_counter = clock
+
+
+def test_game_host_output_backpressure() -> None:
+    """Test that a GameHost stops reading from a client that asks for the
+    board without reading the replies, so the replies waiting to be sent
+    stay bounded."""
+    grid = '\n'.join(['P' + '-' * 199] + ['-' * 199 + 'R'] * 199)
+
+    async def play() -> list:
+        host = GameHost(level_boards(grid))
+        server = await host.serve_tcp()
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        await reader.readline()
+        writer.write(b'S\n' * 1000)
+        session = host.sessions[0]
+        for _ in range(200):
+            await host.tick()
+            await asyncio.sleep(0)
+        waiting = session.writer.transport.get_write_buffer_size()
+        host.stop()
+        return [waiting < 1000000, session.board.turns]
+
+    # with a clock that never moves, every turn is played on the event loop
+    # and no turn is ever skipped for being slow
+    clock = racoon_raiders_host.perf_counter
+    racoon_raiders_host.perf_counter = lambda: 0.0
+    try:
+        assert asyncio.run(play()) == [True, 200]
+    finally:
+        racoon_raiders_host.perf_counter = clock
+
+
+def test_vector_env_matches_boards() -> None:
+    """Test that a VectorEnv plays each of its boards exactly like
+    give_turns, and starts finished games again."""
+    levels = ['P-B-R\n-B--O\nR-C-S', 'PB--R\n--B--\nS-O-R']
+    env = VectorEnv(levels, 6, seed=3, max_turns=150)
+    size = env.width * env.height
+    rng = random.Random(0)
+    dones = 0
+    for _ in range(300):
+        copies = [board.clone() for board in env.boards]
+        actions = [rng.choice(range(len(ACTIONS))) for _ in copies]
+        actions[0] = NO_ACTION
+        observations, rewards, done = env.step(actions)
+        for i, copy in enumerate(copies):
+            if ACTIONS[actions[i]] is not None:
+                copy.handle_event(ACTIONS[actions[i]])
+            copy.give_turns()
+            if done[i]:
+                dones += 1
+                assert copy.ended or copy.turns == 150
+                assert rewards[i] == (copy.check_game_end() or 0)
+                assert env.boards[i].turns == 0
+            else:
+                assert rewards[i] == 0
+                assert env.boards[i].turns == copy.turns
+                assert str(env.boards[i]) == str(copy)
+            grid = str(env.boards[i]).replace('\n', '')
+            assert observations[i * size:(i + 1) * size].decode() == grid
+    assert dones > 0
+
+
+def test_observation_view() -> None:
+    """Test that the observation of a board is a read-only view of its tile
+    codes that follows every change to the board."""
+    for kind in [GameBoard, CompactGameBoard]:
+        b = kind(1, 1)
+        b.setup_from_grid('P-B-\n-BRB\n--BO\n-C-S')
+        view = b.observation()
+        assert view.readonly and view.shape == (4, 4)
+        assert [bytes(row).decode() for row in view.tolist()] == \
+            [''.join(row) for row in b.to_grid()]
+        for direction in [RIGHT, RIGHT, DOWN]:
+            b.handle_event(direction)
+            b.give_turns()
+        b.advance(RACCOON_TURN_FREQUENCY)
+        assert bytes(view).decode() == str(b).replace('\n', '')
+        b.load_level(['-S--', '----', 'B--P', '-O--'])
+        assert bytes(view).decode() == str(b).replace('\n', '')
+        try:
+            view[0, 0] = ord('R')
+            assert False, 'the view should be read-only'
+        except TypeError:
+            pass
+    try:
+        SparseGameBoard(3, 3).observation()
+        assert False, 'a SparseGameBoard has no observation view'
+    except ValueError:
+        pass
+
+
+def test_take_changes_redraws_board() -> None:
+    """Test that drawing only the tiles given by take_changes after every
+    turn keeps a copy of the board exactly up to date."""
+    rng = random.Random(2)
+    level = 'P-B-R-\n-BB-O-\nR-C-SB\n--B@--\nS-O-RB'
+    for board in busy_boards_setup(5, level):
+        for b in [board.clone(), board]:
+            drawn = [['-'] * b.width for _ in range(b.height)]
+            for turn in range(120):
+                if turn % 10 == 9:
+                    b.advance(RACCOON_TURN_FREQUENCY)
+                else:
+                    b.handle_event(rng.choice(DIRECTIONS))
+                    b.give_turns()
+                for x, y, char in b.take_changes():
+                    drawn[y][x] = char
+                assert drawn == b.to_grid()
+            assert b.take_changes() == []
+
+
+def test_positions_index() -> None:
+    """Test that the positions of every kind of tile stay up to date as the
+    game is played, on every kind of board and on clones."""
+    rng = random.Random(4)
+    level = 'P-B-R-\n-BB-O-\nR-C-SB\n--B@--\nS-O-RB'
+    for board in busy_boards_setup(3, level):
+        for b in [board, board.clone()]:
+            for _ in range(100):
+                b.handle_event(rng.choice(DIRECTIONS))
+                b.advance(rng.randrange(1, RACCOON_TURN_FREQUENCY + 1))
+                grid = b.to_grid()
+                for char in 'PRSBOC@':
+                    found = [(x, y) for y, row in enumerate(grid)
+                             for x, c in enumerate(row) if c == char]
+                    assert b.positions_of(char) == found
+                    x0, y0 = rng.randrange(-1, 6), rng.randrange(-1, 5)
+                    x1, y1 = x0 + rng.randrange(4), y0 + rng.randrange(4)
+                    assert b.positions_in(char, x0, y0, x1, y1) == \
+                        [(x, y) for x, y in found
+                         if x0 <= x <= x1 and y0 <= y <= y1]
+                x, y = rng.randrange(-1, 7), rng.randrange(-1, 6)
+                assert b.raccoon_can_enter(x, y) == \
+                    (b.on_board(x, y) and grid[y][x] in '-O')
+
+
 if __name__ == '__main__':
     import pytest
 
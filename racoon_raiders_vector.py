@@ -0,0 +1,212 @@
+"""Raccoon Raiders: vector environment
+
+=== Module Description ===
+This module steps many games of Raccoon Raiders in lockstep, for training
+agents. A VectorEnv holds a number of boards of the same size, each playing
+a level from a pool, and its step method plays one turn on every board given
+an action for each Player.
+
+The results of every board are kept together in flat arrays rather than on
+each board: the tile codes of all of the boards in one bytearray, and the
+rewards and done flags in one list and one bytearray, which are updated in
+place by every step. A board whose game ends (or runs out of turns) is
+started again straight away on a level picked at random from the pool, by
+cloning a copy of the level that was set up when the environment was made.
+
+Most turns are ones where the Player does not move and the raccoons do not
+get a turn, and on those turns nothing on a board can change. So those turns
+are only counted, and a board's tile codes are only copied into the
+observations when its state_hash has changed.
+"""
+
+from __future__ import annotations
+
+import random
+from typing import List, Optional, Sequence, Tuple
+
+from racoon_raiders_compact import CompactGameBoard
+from racoon_raiders_src import DIRECTIONS, RACCOON_TURN_FREQUENCY, GameBoard
+
+# The move made for each action, where None means not moving
+ACTIONS = DIRECTIONS + [None]
+NO_ACTION = ACTIONS.index(None)
+
+
+class VectorEnv:
+    """A number of games of Raccoon Raiders that are played in lockstep.
+
+    The observation of a board is its tile codes: for each tile, in rows from
+    the top, the ord of the letter to_grid would show for it. Board i's tiles
+    are observations[i * width * height:(i + 1) * width * height].
+
+    === Public Attributes ===
+    num_envs:
+        how many boards are played
+    width, height:
+        the size of every board
+    boards:
+        the board of each game being played
+    observations:
+        the tile codes of every board
+    rewards:
+        the reward of each board from the last step: the final score (as
+        given by check_game_end) of a game that ended on that step, and 0
+        otherwise
+    dones:
+        1 for each board whose game ended or ran out of turns on the last
+        step, and was started again, and 0 for the others
+    max_turns:
+        the number of turns after which a game that has not ended is started
+        again, or None if games are only started again when they end
+
+    === Representation Invariants ===
+    - len(boards) == len(rewards) == len(dones) == num_envs
+    - len(observations) == num_envs * width * height
+
+    === Sample Usage ===
+    >>> env = VectorEnv(['PB-R'], 2)
+    >>> bytes(env.observations)
+    b'PB-RPB-R'
+    >>> right = ACTIONS.index((1, 0))
+    >>> _ = env.step([right, NO_ACTION])
+    >>> env.rewards, list(env.dones)
+    ([11, 0], [1, 0])
+    >>> bytes(env.observations)
+    b'PB-RPB-R'
+    """
+    num_envs: int
+    width: int
+    height: int
+    boards: List[GameBoard]
+    observations: bytearray
+    rewards: List[int]
+    dones: bytearray
+    max_turns: Optional[int]
+    # === Private Attributes ===
+    # _levels:
+    #   a board set up with each level in the pool, which is never played
+    # _rng:
+    #   picks the level and seed of every game that is started
+    # _views:
+    #   the observation view of each board
+    # _hashes:
+    #   the state_hash of each board when it was last copied into the
+    #   observations
+    _levels: List[GameBoard]
+    _rng: random.Random
+    _views: List[memoryview]
+    _hashes: List[int]
+
+    def __init__(self, levels: Sequence[str], num_envs: int, seed: int = 0,
+                 max_turns: Optional[int] = None) -> None:
+        """Initialize an environment of <num_envs> games, each of a level
+        picked at random from <levels>, with the games and the levels picked
+        determined by <seed>.
+
+        Raise a ValueError if <levels> is empty, or if its levels are not all
+        the same size.
+
+        Precondition:
+        - every level has one Player
+        """
+        if not levels:
+            raise ValueError('the level pool is empty')
+        self._levels = []
+        for grid in levels:
+            board = CompactGameBoard(1, 1)
+            board.setup_from_grid(grid)
+            self._levels.append(board)
+        self.width = self._levels[0].width
+        self.height = self._levels[0].height
+        if any((board.width, board.height) != (self.width, self.height)
+               for board in self._levels):
+            raise ValueError('the levels are not all the same size')
+
+        self.num_envs = num_envs
+        self.max_turns = max_turns
+        self._rng = random.Random(seed)
+        self.boards = [self._levels[0]] * num_envs
+        self._views = [self._levels[0].observation()] * num_envs
+        self._hashes = [0] * num_envs
+        self.observations = bytearray(num_envs * self.width * self.height)
+        self.rewards = [0] * num_envs
+        self.dones = bytearray(num_envs)
+        self.reset()
+
+    def reset(self) -> bytearray:
+        """Start every game again, and return the observations."""
+        for i in range(self.num_envs):
+            self._restart(i)
+        self.rewards = [0] * self.num_envs
+        self.dones = bytearray(self.num_envs)
+        return self.observations
+
+    def step(self, actions: Sequence[int]) \
+            -> Tuple[bytearray, List[int], bytearray]:
+        """Play one turn on every board, where the Player of board i makes
+        the move ACTIONS[actions[i]], and return the observations, rewards
+        and done flags afterwards.
+
+        The arrays returned are the ones that are updated by every step, so
+        they should be copied if they are needed after the next step. The
+        observation of a board that is done is of its new game.
+
+        Precondition:
+        - len(actions) == num_envs
+        """
+        size = self.width * self.height
+        observations = self.observations
+        rewards = self.rewards
+        dones = self.dones
+        views = self._views
+        hashes = self._hashes
+        max_turns = self.max_turns
+        for i, board in enumerate(self.boards):
+            action = ACTIONS[actions[i]]
+            if action is None and \
+                    (board.turns + 1) % RACCOON_TURN_FREQUENCY:
+                # nothing can move, as in GameBoard.advance
+                board.turns += 1
+            else:
+                if action is not None:
+                    board.handle_event(action)
+                board.give_turns()
+            if board.ended or board.turns == max_turns:
+                rewards[i] = board.check_game_end() or 0
+                dones[i] = 1
+                self._restart(i)
+                continue
+            rewards[i] = 0
+            dones[i] = 0
+            if board.state_hash != hashes[i]:
+                hashes[i] = board.state_hash
+                observations[i * size:(i + 1) * size] = views[i]
+        return observations, rewards, dones
+
+    def _restart(self, i: int) -> None:
+        """Start a new game on board <i>, of a level picked at random from
+        the pool, and update its observation.
+        """
+        board = self._rng.choice(self._levels).clone()
+        board.seed = self._rng.getrandbits(32)
+        board.rng.seed(board.seed)
+        self.boards[i] = board
+        self._views[i] = board.observation()
+        self._hashes[i] = board.state_hash
+        size = self.width * self.height
+        self.observations[i * size:(i + 1) * size] = self._views[i]
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
+
+    import python_ta
+    python_ta.check_all(config={
+        'allowed-io': [],
+        'allowed-import-modules': ['doctest', 'python_ta', 'typing',
+                                   '__future__', 'random',
+                                   'racoon_raiders_compact',
+                                   'racoon_raiders_src'],
+        'disable': ['E1136'],
+    })